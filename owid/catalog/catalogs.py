@@ -3,22 +3,27 @@
 #  owid-catalog-py
 #
 
-import heapq
+import bisect
+import io
 import json
 import os
 import re
-import tempfile
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Dict, Iterable, Iterator, List, Optional, Union, cast
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union, cast
 from urllib.parse import urlparse
 
 import numpy as np
 import numpy.typing as npt
 import pandas as pd
-import requests
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
 import structlog
 
-from . import s3_utils
+from . import http, s3_utils
 from .datasets import CHANNEL, PREFERRED_FORMAT, SUPPORTED_FORMATS, Dataset, FileFormat
 from .tables import Table
 
@@ -39,6 +44,20 @@ REMOTE_CATALOG: Optional["RemoteCatalog"] = None
 # what formats should we for our index of available datasets?
 INDEX_FORMATS: List[FileFormat] = ["feather", "parquet"]
 
+# `promote` was superseded by `promote_options` in pyarrow 14
+_PROMOTE_OPTIONS: Dict[str, Any] = (
+    {"promote_options": "default"} if int(pyarrow.__version__.split(".")[0]) >= 14 else {"promote": True}
+)
+
+# low-cardinality columns `find` compares on categorical codes; the frame itself keeps
+# plain values, the codes are only built for the lookup arrays, see `_column_arrays`
+CATEGORICAL_COLUMNS = ["namespace", "channel", "dataset", "version"]
+
+_NO_ROWS: npt.NDArray[np.intp] = np.array([], dtype=np.intp)
+
+# how many recent `find` results to remember per catalog frame
+FIND_CACHE_SIZE = 256
+
 
 class CatalogMixin:
     """
@@ -49,6 +68,98 @@ class CatalogMixin:
     frame: "CatalogFrame"
     uri: str
 
+    # raw arrays of the columns `find` filters on, along with the frame they came from and
+    # how many times it had been edited in place by then
+    _find_arrays: Optional[Tuple["CatalogFrame", int, Dict[str, Any]]] = None
+
+    def _column_arrays(self) -> Dict[str, Any]:
+        """
+        Return the columns we filter on as numpy arrays, or categoricals for those in
+        CATEGORICAL_COLUMNS, computed once per frame and reused by every call to `find`.
+        They are built again, along with everything remembered next to them, whenever
+        the frame is replaced or edited in place (see `CatalogFrame._edits`).
+        """
+        edits = getattr(self.frame, "_edits", 0)
+        if self._find_arrays is None or self._find_arrays[0] is not self.frame or self._find_arrays[1] != edits:
+            arrays: Dict[str, Any] = {"table": self.frame["table"].to_numpy()}
+            for col in CATEGORICAL_COLUMNS:
+                arrays[col] = pd.Categorical(self.frame[col])
+            self._find_arrays = (self.frame, edits, arrays)
+
+        return self._find_arrays[2]
+
+    def _matching_rows(
+        self,
+        table: Optional[str],
+        namespace: Optional[str],
+        version: Optional[str],
+        dataset: Optional[str],
+        channel: Optional[CHANNEL],
+    ) -> Optional[npt.NDArray[np.intp]]:
+        """
+        Positions of the rows matching all given filters, or None if no filter is given.
+        Recent results are remembered along with the other arrays of the frame, so
+        repeated searches are just a slice.
+        """
+        arrays = self._column_arrays()
+        results = arrays.setdefault("results", OrderedDict())
+
+        key = (table, namespace, version, dataset, channel)
+        if key in results:
+            results.move_to_end(key)
+            return results[key]
+
+        # positions of the rows still matching, None while no filter has been applied
+        rows: Optional[npt.NDArray[np.intp]] = None
+
+        # regex match on the name, usually the most selective filter so it goes first
+        if table:
+            # only built once we search by table name, since it joins all of them
+            if "table_index" not in arrays:
+                arrays["table_index"] = _TableNameIndex(arrays["table"])
+            rows = np.flatnonzero(arrays["table_index"].search(table))
+
+        equalities = [
+            (col, value)
+            for col, value in (
+                ("namespace", namespace),
+                ("version", version),
+                ("dataset", dataset),
+                ("channel", channel),
+            )
+            if value
+        ]
+
+        # without a table filter, start from the rows of the rarest value, looked up directly
+        if rows is None and equalities:
+            candidates = [self._value_positions(col).get(value, _NO_ROWS) for col, value in equalities]
+            start = int(np.argmin([len(c) for c in candidates]))
+            rows = candidates[start]
+            del equalities[start]
+
+        # every further filter only looks at the rows that survived the previous ones
+        for col, value in equalities:
+            rows = cast(npt.NDArray[np.intp], rows)[_equals(arrays[col][rows], value)]
+
+        results[key] = rows
+        if len(results) > FIND_CACHE_SIZE:
+            results.popitem(last=False)
+
+        return rows
+
+    def _value_positions(self, col: str) -> Dict[Any, npt.NDArray[np.intp]]:
+        """
+        Map every value of a column to the positions of its rows, built on first use and
+        kept along with the other arrays of the frame.
+        """
+        arrays = self._column_arrays()
+        key = f"{col}_positions"
+        if key not in arrays:
+            values = arrays[col]
+            arrays[key] = pd.Series(values).groupby(values, sort=False, observed=True).indices
+
+        return cast(Dict[Any, npt.NDArray[np.intp]], arrays[key])
+
     def find(
         self,
         table: Optional[str] = None,
@@ -57,30 +168,15 @@ class CatalogMixin:
         dataset: Optional[str] = None,
         channel: Optional[CHANNEL] = None,
     ) -> "CatalogFrame":
-        criteria: npt.ArrayLike = np.ones(len(self.frame), dtype=bool)
-
-        if table:
-            criteria &= self.frame.table.str.contains(table)
-
-        if namespace:
-            criteria &= self.frame.namespace == namespace
-
-        if version:
-            criteria &= self.frame.version == version
-
-        if dataset:
-            criteria &= self.frame.dataset == dataset
+        if channel and channel not in self.channels:
+            raise ValueError(
+                f"You need to add `{channel}` to channels in Catalog init (only `{self.channels}` are loaded now)"
+            )
 
-        if channel:
-            if channel not in self.channels:
-                raise ValueError(
-                    f"You need to add `{channel}` to channels in Catalog init (only `{self.channels}` are loaded now)"
-                )
-            criteria &= self.frame.channel == channel
+        rows = self._matching_rows(table, namespace, version, dataset, channel)
+        matches = self.frame if rows is None else self.frame.iloc[rows]
 
-        matches = self.frame[criteria]
-        if "checksum" in matches.columns:
-            matches = matches.drop(columns=["checksum"])
+        matches = matches.drop(columns="checksum", errors="ignore")
 
         return cast(CatalogFrame, matches)
 
@@ -95,8 +191,15 @@ class CatalogMixin:
         frame = self.find(*args, **kwargs)  # type: ignore
         if frame.empty:
             raise ValueError("No matching table found")
-        else:
-            return cast(Table, frame.sort_values("version").iloc[-1].load())
+
+        return cast(Table, frame.iloc[_latest_position(frame["version"])].load())
+
+    def load_dimensions(self) -> "CatalogFrame":
+        """
+        The catalog frame with its dimensions. They are always loaded along with the rest
+        of the index, this is only kept for code that still calls it.
+        """
+        return self.frame
 
     def __getitem__(self, path: str) -> Table:
         uri = "/".join([self.uri.rstrip("/"), path])
@@ -119,17 +222,21 @@ class LocalCatalog(CatalogMixin):
     uri: str
 
     def __init__(self, path: Union[str, Path], channels: Iterable[CHANNEL] = ("garden",)) -> None:
+        # channels are iterated several times, so don't let a generator run dry
+        channels = list(channels)
         self.uri = str(path)
         self.channels = channels
-        if self._catalog_exists(channels):
+        missing = [channel for channel in channels if not self._catalog_channel_file(channel).exists()]
+        if not missing:
             self.frame = CatalogFrame(self._read_channels(channels))
             self.frame._base_uri = self.path.as_posix() + "/"
+        elif len(missing) < len(channels):
+            # only index the channels we have no catalog file for
+            self._index_channels(missing)
         else:
             # could take a while to generate if there are many datasets
             self.reindex()
 
-        # ensure the frame knows where to load data from
-
     @property
     def path(self) -> Path:
         return Path(self.uri)
@@ -148,26 +255,28 @@ class LocalCatalog(CatalogMixin):
         """
         Read selected channels from local path.
         """
-        df = pd.concat([read_frame(self._catalog_channel_file(channel)) for channel in channels])
-        df.dimensions = df.dimensions.map(lambda s: json.loads(s) if isinstance(s, str) else s)
-        return df
+        return _read_index_files([self._catalog_channel_file(channel) for channel in channels])
 
     def iter_datasets(self, channel: CHANNEL, include: Optional[str] = None) -> Iterator[Dataset]:
-        to_search = [self.path / channel]
-        if not to_search[0].exists():
+        # keep plain strings while walking, we only need a Path for the datasets we yield
+        to_search = deque([os.path.join(os.fspath(self.path), channel)])
+        if not os.path.exists(to_search[0]):
             return
 
         re_search = re.compile(include or "")
 
+        # the order we visit datasets in doesn't matter, the index gets sorted afterwards
         while to_search:
-            dir = heapq.heappop(to_search)
-            if (dir / "index.json").exists() and re_search.search(str(dir)):
-                yield Dataset(dir)
+            dir = to_search.popleft()
+            if os.path.isfile(os.path.join(dir, "index.json")) and re_search.search(dir):
+                yield Dataset(Path(dir))
                 continue
 
-            for child in dir.iterdir():
-                if child.is_dir():
-                    heapq.heappush(to_search, child)
+            # scandir gets the entry type from the directory listing, saving a stat per child
+            with os.scandir(dir) as entries:
+                for entry in entries:
+                    if entry.is_dir():
+                        to_search.append(entry.path)
 
     def reindex(self, include: Optional[str] = None) -> None:
         """
@@ -180,6 +289,23 @@ class LocalCatalog(CatalogMixin):
             # we used regex to find datasets, so merge it with the original frame
             index = self._merge_index(self.frame, index)
 
+        index = self._prepare_index(index)
+
+        self._save_index(index)
+        self.frame = index
+
+    def _index_channels(self, channels: List[CHANNEL]) -> None:
+        """
+        Index the given channels and save their catalog files, then load the whole
+        catalog. Catalog files of other channels are left as they are.
+        """
+        index = self._prepare_index(self._scan_for_datasets(channels=channels))
+        self._save_index(index, channels=channels)
+
+        self.frame = CatalogFrame(self._read_channels(self.channels))
+        self.frame._base_uri = self.path.as_posix() + "/"
+
+    def _prepare_index(self, index: "CatalogFrame") -> "CatalogFrame":
         index._base_uri = self.path.as_posix() + "/"
 
         # convert int versions to strings
@@ -188,8 +314,7 @@ class LocalCatalog(CatalogMixin):
         # make sure dimensions json is loaded
         index.dimensions = index.dimensions.map(lambda s: json.loads(s) if isinstance(s, str) else s)
 
-        self._save_index(index)
-        self.frame = index
+        return cast(CatalogFrame, _coerce_is_public(index))
 
     @staticmethod
     def _merge_index(frame: "CatalogFrame", update: "CatalogFrame") -> "CatalogFrame":
@@ -201,43 +326,66 @@ class LocalCatalog(CatalogMixin):
             )
         )
 
-    def _save_index(self, frame: "CatalogFrame") -> None:
+    def _save_index(self, frame: "CatalogFrame", channels: Optional[Iterable[CHANNEL]] = None) -> None:
         """
-        Save all channels to disk in separate catalog files, and in each of our
-        supported formats.
+        Save all channels (or just the given ones) to disk in separate catalog files,
+        and in each of our supported formats.
         """
-        for channel in self.channels:
-            channel_frame = frame.loc[frame.channel == channel].reset_index(drop=True)
+        # split by channel in one pass, rather than masking the frame once per channel
+        positions = frame.groupby("channel", sort=False, observed=True).indices
+        for channel in channels or self.channels:
+            channel_frame = frame.iloc[positions.get(channel, [])].reset_index(drop=True)
+
+            # convert to arrow once and write the same table in every format
+            table = pyarrow.Table.from_pandas(channel_frame, preserve_index=False)
             for format in INDEX_FORMATS:
                 filename = self._catalog_channel_file(channel, format)
-                save_frame(channel_frame, filename)
+                _save_arrow_table(table, filename)
 
         # add a catalog version number that we can use to tell old clients to update
         self._save_metadata({"format_version": OWID_CATALOG_VERSION})
 
-    def _scan_for_datasets(self, include: Optional[str] = None) -> "CatalogFrame":
-        """Scan datasets. You can filter by `include` to get better performance."""
-        frames = []
-        log.info("reindex.start", channels=self.channels, include=include)
-        for channel in self.channels:
-            channel_frames = []
-            for ds in self.iter_datasets(channel, include=include):
-                channel_frames.append(ds.index(self.path))
-            frames += channel_frames
+    def _scan_for_datasets(
+        self, include: Optional[str] = None, channels: Optional[Iterable[CHANNEL]] = None
+    ) -> "CatalogFrame":
+        """Scan datasets. You can filter by `include` or `channels` to get better performance."""
+        channels = channels or self.channels
+        columns: Dict[str, List[Any]] = {}
+        log.info("reindex.start", channels=channels, include=include)
+
+        datasets = {channel: list(self.iter_datasets(channel, include=include)) for channel in channels}
+        for channel, channel_datasets in datasets.items():
             log.info(
                 "reindex",
                 channel=channel,
-                datasets=len(channel_frames),
+                datasets=len(channel_datasets),
                 include=include,
             )
 
-        df = pd.concat(frames, ignore_index=True)
+        # indexing is mostly waiting on reads and md5 (which releases the GIL), so threads
+        # are enough; datasets of all channels share the pool so it never drains in between
+        with ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 2) as executor:
+            all_datasets = [ds for channel_datasets in datasets.values() for ds in channel_datasets]
+            for dataset_columns in executor.map(lambda ds: ds._index_columns(self.path), all_datasets):
+                for name, values in dataset_columns.items():
+                    columns.setdefault(name, []).extend(values)
 
         keys = ["table", "dataset", "version", "namespace", "channel", "is_public"]
-        columns = keys + [c for c in df.columns if c not in keys]
 
-        df.sort_values(keys, inplace=True)  # type: ignore
-        df = df.loc[:, columns]
+        if not columns.get("table"):
+            # nothing to index, but keep the columns so the frame can still be saved and searched
+            return CatalogFrame(columns=keys + ["checksum", "dimensions", "path", "formats"])
+
+        # build a single frame from all columns, rather than one per dataset
+        df = pd.DataFrame(columns)
+        order_columns = keys + [c for c in df.columns if c not in keys]
+
+        # sort with arrow's kernel, converting only the key columns
+        order = pc.sort_indices(
+            pyarrow.Table.from_pandas(df[keys], preserve_index=False),
+            sort_keys=[(key, "ascending") for key in keys],
+        )
+        df = df.iloc[order.to_numpy(), :].loc[:, order_columns]
 
         return CatalogFrame(df)
 
@@ -260,8 +408,31 @@ class RemoteCatalog(CatalogMixin):
                 "-- please update"
             )
 
-        self.frame = CatalogFrame(self._read_channels(uri, channels))
-        self.frame._base_uri = uri
+        # local copies of the channel indexes we have loaded
+        self._channel_files: Dict[CHANNEL, Union[str, Path]] = {}
+        self._load_channels(channels)
+
+    def add_channel(self, channel: CHANNEL) -> None:
+        """
+        Make the given channel searchable, only downloading its own index.
+        """
+        self._load_channels([channel])
+
+    def _load_channels(self, channels: Iterable[CHANNEL]) -> None:
+        """
+        Make sure the given channels are in the frame. Channels we already have are
+        not downloaded again.
+        """
+        missing = [channel for channel in channels if channel not in self._channel_files]
+        for channel in missing:
+            self._channel_files[channel] = self._channel_file(self.uri, channel)
+
+        if missing:
+            # re-reading the local copies concatenates in arrow, without a pandas concat
+            # or keeping a second copy of every channel around
+            self.channels = tuple(self._channel_files)
+            self.frame = CatalogFrame(_read_index_files(list(self._channel_files.values())))
+            self.frame._base_uri = self.uri
 
     @property
     def datasets(self) -> pd.DataFrame:
@@ -270,18 +441,38 @@ class RemoteCatalog(CatalogMixin):
     @staticmethod
     def _read_metadata(uri: str) -> Dict[str, Any]:
         """
-        Read the metadata JSON blob for this repo.
+        Read the metadata JSON blob for this repo. Like the channel files, it is cached on
+        disk and revalidated on every read, so an updated catalog is always seen while an
+        unchanged one only costs a 304.
         """
-        resp = requests.get(uri)
-        resp.raise_for_status()
-        return cast(Dict[str, Any], resp.json())
+        return cast(Dict[str, Any], json.loads(http.read_bytes(http.cached_download(uri))))
+
+    @staticmethod
+    def _channel_file(uri: str, channel: CHANNEL) -> Union[str, Path]:
+        return http.cached_download(uri + f"catalog-{channel}.{PREFERRED_FORMAT}")
 
     @staticmethod
     def _read_channels(uri: str, channels: Iterable[CHANNEL]) -> pd.DataFrame:
         """
         Read selected channels from S3.
         """
-        return pd.concat([read_frame(uri + f"catalog-{channel}.{PREFERRED_FORMAT}") for channel in channels])
+        return _read_index_files([RemoteCatalog._channel_file(uri, channel) for channel in channels])
+
+
+class CatalogSeries(pd.Series):
+    """
+    A row from the catalog representing a single dataset. We subclass Series
+    in order to add a `load()` method onto it that will fetch and return a Table.
+    """
+
+    _metadata = ["_base_uri"]
+
+    @property
+    def _constructor(self) -> type:
+        return CatalogSeries
+
+    def load(self) -> Table:
+        return _load_table(self, getattr(self, "_base_uri", None))
 
 
 class CatalogFrame(pd.DataFrame):
@@ -293,23 +484,28 @@ class CatalogFrame(pd.DataFrame):
 
     _metadata = ["_base_uri"]
 
+    # rows and columns we pick keep `_base_uri`, since pandas copies everything in
+    # `_metadata` over through `__finalize__`
+    _constructor_sliced = CatalogSeries
+
+    # in-place edits so far, so that `find` knows when its lookup arrays are stale; writing
+    # straight into the arrays backing the frame (e.g. via `.values`) goes unnoticed
+    _edits: int = 0
+
     @property
     def _constructor(self) -> type:
         return CatalogFrame
 
-    @property
-    def _constructor_sliced(self) -> Any:
-        # ensure that when we pick a series we still have the URI
-        def build(*args: Any, **kwargs: Any) -> Any:
-            c = CatalogSeries(*args, **kwargs)
-            c._base_uri = self._base_uri
-            return c
-
-        return build
+    def _clear_item_cache(self) -> None:
+        # pandas calls this on every in-place edit: setting columns or values through
+        # loc/iloc/at, and methods with inplace=True such as drop
+        object.__setattr__(self, "_edits", self._edits + 1)
+        super()._clear_item_cache()
 
     def load(self) -> Table:
         if len(self) == 1:
-            return self.iloc[0].load()  # type: ignore
+            # read the row as a plain dict, no need to build a CatalogSeries for it
+            return _load_table(self.to_dict(orient="records")[0], self._base_uri)
         elif len(self) == 0:
             raise ValueError("no tables found")
         else:
@@ -329,48 +525,42 @@ class CatalogFrame(pd.DataFrame):
         )
 
 
-class CatalogSeries(pd.Series):
+def _load_table(row: Union[pd.Series, Dict[str, Any]], base_uri: Optional[str]) -> Table:
     """
-    A row from the catalog representing a single dataset. We subclass Series
-    in order to add a `load()` method onto it that will fetch and return a Table.
+    Load the table described by a catalog row, given either as a CatalogSeries or
+    as a plain dict.
     """
+    # determine what format to use for this table; old indexes gave one format,
+    # new ones give multiple to choose from
+    format = None
+    if "format" in row:
+        # backwards compatibility with existing indexes
+        format = row["format"]
+    elif row.get("formats") is not None and len(row["formats"]) > 0:
+        formats = row["formats"]
+        format = PREFERRED_FORMAT if PREFERRED_FORMAT in formats else formats[0]
 
-    _metadata = ["_base_uri"]
+    path = row.get("path")
+    if path and format and base_uri:
+        uri = base_uri + path + "." + format
 
-    @property
-    def _constructor(self) -> type:
-        return CatalogSeries
+        # private files have to be downloaded with credentials first
+        # keep backward compatibility
+        if not row.get("is_public", True):
+            return _read_private_table(uri)
 
-    def load(self) -> Table:
-        # determine what format to use for this table; old indexes gave one format,
-        # new ones give multiple to choose from
-        format = None
-        if hasattr(self, "format"):
-            # backwards compatibility with existing indexes
-            format = self.format
-        elif hasattr(self, "formats") and (self.formats is not None) and len(self.formats) > 0:
-            format = PREFERRED_FORMAT if PREFERRED_FORMAT in self.formats else self.formats[0]
+        return Table.read(uri)
 
-        if self.path and format and self._base_uri:
-            with tempfile.TemporaryDirectory() as tmpdir:
-                uri = self._base_uri + self.path + "." + format
-
-                # download the data locally first if the file is private
-                # keep backward compatibility
-                if not getattr(self, "is_public", True):
-                    uri = _download_private_file(uri, tmpdir)
-
-                return Table.read(uri)
-
-        raise ValueError("series is not a table spec")
+    raise ValueError("series is not a table spec")
 
 
 def _load_remote_catalog(channels):
     global REMOTE_CATALOG
 
-    # add channel if missing and reinit remote catalog
-    if REMOTE_CATALOG and not (set(channels) <= set(REMOTE_CATALOG.channels)):
-        REMOTE_CATALOG = RemoteCatalog(channels=list(set(REMOTE_CATALOG.channels) | set(channels)))
+    # add channels if missing, without downloading the ones we already have
+    if REMOTE_CATALOG:
+        for channel in set(channels) - set(REMOTE_CATALOG.channels):
+            REMOTE_CATALOG.add_channel(channel)
 
     if not REMOTE_CATALOG:
         REMOTE_CATALOG = RemoteCatalog(channels=channels)
@@ -407,50 +597,220 @@ def find_latest(
     return REMOTE_CATALOG.find_latest(table=table, namespace=namespace, dataset=dataset, version=version)
 
 
-def _download_private_file(uri: str, tmpdir: str) -> str:
+def _read_private_table(uri: str) -> Table:
+    """
+    Download a private table with its metadata, reading both straight from memory.
+    """
     parsed = urlparse(uri)
     base, ext = os.path.splitext(parsed.path)
-    s3_utils.download(
-        S3_OWID_URI + base + ".meta.json",
-        tmpdir + "/data.meta.json",
-    )
-    s3_utils.download(
-        S3_OWID_URI + base + ext,
-        tmpdir + "/data" + ext,
-    )
-    return tmpdir + "/data" + ext
+    if ext not in (".csv", ".feather", ".parquet"):
+        raise ValueError(f"could not detect a suitable format to read from: {uri}")
+
+    # fetch the metadata sidecar and the data at the same time
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        metadata, data = executor.map(
+            s3_utils.download_to_buffer, [S3_OWID_URI + base + ".meta.json", S3_OWID_URI + base + ext]
+        )
+
+    if ext == ".csv":
+        # same options as `Table.read_csv`
+        df = Table(pd.read_csv(io.BytesIO(data), index_col=False, na_values=[""], keep_default_na=False))
+    elif ext == ".feather":
+        df = Table(pd.read_feather(io.BytesIO(data)))
+    else:
+        df = Table(pd.read_parquet(io.BytesIO(data)))
+
+    Table._add_metadata_from_dict(df, json.loads(metadata))
+    return df
+
+
+def _parse_dimensions(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Indexes store dimensions as a native list column, only legacy indexes need their
+    JSON-encoded dimensions parsing. A file is written in one go, so checking the first
+    row is enough.
+    """
+    if "dimensions" in df.columns and len(df) and isinstance(df.dimensions.iloc[0], str):
+        df["dimensions"] = df.dimensions.map(json.loads)
+    return df
+
+
+def _coerce_is_public(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Store `is_public` as plain booleans when every row has the flag; missing flags are left
+    as they are, see `_load_table`.
+    """
+    if "is_public" in df.columns and df["is_public"].dtype != bool and df["is_public"].notna().all():
+        df["is_public"] = df["is_public"].astype(bool)
+
+    return df
+
+
+class _TableNameIndex:
+    """
+    Regex search over table names, like `str.contains`. Patterns without any special
+    characters are plain substrings, so for those all names are joined into a single
+    string and matches are located with str.find in C, and only matching rows cost any
+    Python work. Searches matching a large share of rows fall back to a vectorised
+    scan with Arrow's substring kernel.
+    """
+
+    SEPARATOR = "\n"
+
+    def __init__(self, names: npt.NDArray[Any]) -> None:
+        self.names = names
+        self.offsets: List[int] = []
+        self.haystack: Optional[str] = None
+        self._arrow_names: Optional[pyarrow.Array] = None
+
+        if all(isinstance(name, str) and self.SEPARATOR not in name for name in names):
+            offset = 0
+            for name in names:
+                self.offsets.append(offset)
+                offset += len(name) + 1
+            self.haystack = self.SEPARATOR.join(names)
+
+    def search(self, pattern: str) -> npt.NDArray[np.bool_]:
+        """Mask of the names matching the regex `pattern` anywhere; missing names never match."""
+        if re.escape(pattern) == pattern:
+            return self.contains(pattern)
+
+        matches = pd.Series(self.names, dtype=object).str.contains(pattern, regex=True, na=False)
+        return cast(npt.NDArray[np.bool_], matches.to_numpy(dtype=bool))
+
+    def contains(self, needle: str) -> npt.NDArray[np.bool_]:
+        if self.haystack is not None and self.SEPARATOR not in needle:
+            mask = np.zeros(len(self.names), dtype=bool)
+            max_hits = max(16, len(self.names) // 64)
+            hits = 0
+
+            pos = self.haystack.find(needle)
+            while pos != -1 and hits < max_hits:
+                row = bisect.bisect_right(self.offsets, pos) - 1
+                mask[row] = True
+                hits += 1
+
+                # continue from the next name, we already know this one matches
+                if row + 1 == len(self.offsets):
+                    return mask
+                pos = self.haystack.find(needle, self.offsets[row + 1])
+
+            if pos == -1:
+                return mask
+
+        return self._scan(needle)
+
+    def _scan(self, needle: str) -> npt.NDArray[np.bool_]:
+        # missing names never match, like str.contains(..., na=False)
+        if self._arrow_names is None:
+            self._arrow_names = pyarrow.array(self.names, type=pyarrow.string(), from_pandas=True)
+        matches = pc.fill_null(pc.match_substring(self._arrow_names, needle), False)
+        return cast(npt.NDArray[np.bool_], matches.to_numpy(zero_copy_only=False))
+
+
+def _latest_position(versions: pd.Series) -> int:
+    """
+    Position of the row with the highest version (compared as strings), without sorting.
+    On ties take the last row, like a stable sort would.
+    """
+    values = versions.astype(str).to_numpy()
+    is_latest = values == max(values)
+
+    return len(is_latest) - 1 - int(np.argmax(is_latest[::-1]))
+
+
+def _equals(values: Union[pd.Categorical, npt.NDArray[Any]], value: Any) -> npt.NDArray[np.bool_]:
+    """Compare column values against a scalar, using integer codes for categoricals."""
+    if isinstance(values, pd.Categorical):
+        try:
+            code = values.categories.get_loc(value)
+        except KeyError:
+            return np.zeros(len(values), dtype=bool)
+        return cast(npt.NDArray[np.bool_], values.codes == code)
+
+    return cast(npt.NDArray[np.bool_], values == value)
 
 
 class PackageUpdateRequired(Exception):
     pass
 
 
-def read_frame(uri: Union[str, Path]) -> pd.DataFrame:
+def read_frame(uri: Union[str, Path], columns: Optional[List[str]] = None) -> pd.DataFrame:
     if isinstance(uri, Path):
         uri = str(uri)
 
     if uri.endswith(".feather"):
-        return cast(pd.DataFrame, pd.read_feather(uri))
+        return cast(pd.DataFrame, pd.read_feather(uri, columns=columns))
 
     elif uri.endswith(".parquet"):
-        return cast(pd.DataFrame, pd.read_parquet(uri))
+        return cast(pd.DataFrame, pd.read_parquet(uri, columns=columns))
 
     elif uri.endswith(".csv"):
-        return pd.read_csv(uri)
+        return pd.read_csv(uri, usecols=columns)
 
     raise ValueError(f"could not detect format of uri: {uri}")
 
 
-def save_frame(df: pd.DataFrame, path: Union[str, Path]) -> None:
+def _read_index_files(filenames: List[Union[str, Path]]) -> pd.DataFrame:
+    """
+    Read index files into a single frame, with their dimensions parsed.
+    """
+    if not all(str(f).endswith((".feather", ".parquet")) for f in filenames):
+        # e.g. a csv index, which Arrow can't read for us
+        df = pd.concat([read_frame(f) for f in filenames])
+        return _coerce_is_public(_parse_dimensions(df))
+
+    # concatenate in arrow, which does not copy, and convert to pandas just once
+    tables = [_read_arrow_table(filename) for filename in filenames]
+    df = _concat_tables(tables).to_pandas(split_blocks=True, self_destruct=True)
+    return _coerce_is_public(_parse_dimensions(df))
+
+
+def _concat_tables(tables: List[pyarrow.Table]) -> pyarrow.Table:
+    """
+    Concatenate channel tables. Arrow can't merge dictionary columns of different types
+    (e.g. from an empty channel), so if schemas differ we decode them first.
+    """
+    if any(not t.schema.equals(tables[0].schema) for t in tables[1:]):
+        decoded = []
+        for t in tables:
+            for i, field in enumerate(t.schema):
+                if pyarrow.types.is_dictionary(field.type):
+                    t = t.set_column(i, field.name, t.column(i).cast(field.type.value_type))
+            decoded.append(t)
+        tables = decoded
+
+    return pyarrow.concat_tables(tables, **_PROMOTE_OPTIONS)
+
+
+def _read_arrow_table(path: Union[str, Path], columns: Optional[List[str]] = None) -> pyarrow.Table:
     path = str(path)
-    if path.endswith(".feather"):
-        df.to_feather(path)
+    if path.startswith("http"):
+        # read straight from the response, see `http.cached_download`
+        source = pyarrow.BufferReader(http.fetch(path))
+        if path.endswith(".feather"):
+            return feather.read_table(source, columns=columns, use_threads=True)
+        elif path.endswith(".parquet"):
+            return pq.read_table(source, columns=columns, use_threads=True)
+
+    elif path.endswith(".feather"):
+        # map the file rather than reading it into memory first, we only copy the columns we need
+        return feather.read_table(path, columns=columns, use_threads=True, memory_map=True)
 
     elif path.endswith(".parquet"):
-        df.to_parquet(path)
+        return pq.read_table(path, columns=columns, use_threads=True)
+
+    raise ValueError(f"could not detect format of uri: {path}")
+
 
-    elif path.endswith(".csv"):
-        df.to_csv(path)
+def _save_arrow_table(table: pyarrow.Table, path: Union[str, Path]) -> None:
+    path = str(path)
+    if path.endswith(".feather"):
+        # indexes are mostly repetitive strings and get downloaded by every client, so favour size
+        feather.write_feather(table, path, compression="zstd", compression_level=3)
+
+    elif path.endswith(".parquet"):
+        pq.write_table(table, path, compression="zstd")
 
     else:
         raise ValueError(f"could not detect what format to write to: {path}")
@@ -4,21 +4,23 @@
 
 import hashlib
 import json
+import os
 import shutil
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from glob import glob
 from os import mkdir
 from os.path import join
 from pathlib import Path
-from typing import Any, Iterator, List, Literal, Optional, Union
+from typing import Any, Dict, Iterator, List, Literal, Optional, Tuple, Union, cast
 
 import numpy as np
 import pandas as pd
-import yaml
 
 from . import tables, utils
-from .meta import SOURCE_EXISTS_OPTIONS, DatasetMeta, TableMeta
+from .meta import SOURCE_EXISTS_OPTIONS, DatasetMeta, TableMeta, _load_yaml
 from .properties import metadata_property
 
 FileFormat = Literal["csv", "feather", "parquet"]
@@ -41,6 +43,13 @@ assert SUPPORTED_FORMATS[0] == PREFERRED_FORMAT
 # available channels in the catalog
 CHANNEL = Literal["garden", "meadow", "grapher", "backport", "open_numbers", "examples", "explorers"]
 
+# max number of files of a dataset to hash at the same time
+CHECKSUM_WORKERS = 8
+
+# coarsest file timestamps we expect (FAT, some network mounts); anything that changed this
+# recently may change again without its timestamps moving, so it is not trusted to be settled
+TIMESTAMP_GRANULARITY_NS = 2 * 10**9
+
 # all pandas nullable dtypes
 NULLABLE_DTYPES = [f"{sign}{typ}{size}" for typ in ("Int", "Float") for sign in ("", "U") for size in (8, 16, 32, 64)]
 
@@ -63,6 +72,13 @@ class Dataset:
 
         self.metadata = DatasetMeta.load(self._index_file)
 
+        # (folder identity and timestamps, time listed, file names, table files) of the last
+        # listing of the dataset folder
+        self._listing: Optional[Tuple[Tuple[int, int, int], int, List[str], Dict[str, str]]] = None
+
+        # (file stats, checksum) of the last call to `checksum`
+        self._checksum_cache: Optional[Tuple[Tuple[Tuple[str, int, int, int, int], ...], str]] = None
+
     @classmethod
     def create_empty(cls, path: Union[str, Path], metadata: Optional["DatasetMeta"] = None) -> "Dataset":
         path = Path(path)
@@ -119,18 +135,18 @@ class Dataset:
             table_filename = join(self.path, table.metadata.checked_name + f".{format}")
             table.to(table_filename, repack=repack)
 
-    def __getitem__(self, name: str) -> tables.Table:
-        stem = self.path / Path(name)
+        # new files, list the folder again next time
+        self._listing = None
 
-        for format in SUPPORTED_FORMATS:
-            path = stem.with_suffix(f".{format}")
-            if path.exists():
-                return tables.Table.read(path)
+    def __getitem__(self, name: str) -> tables.Table:
+        table_files = self._table_files()
+        if name in table_files:
+            return tables.Table.read(table_files[name])
 
         raise KeyError(f"Table `{name}` not found, available tables: {', '.join(self.table_names)}")
 
     def __contains__(self, name: str) -> bool:
-        return any((Path(self.path) / name).with_suffix(f".{format}").exists() for format in SUPPORTED_FORMATS)
+        return name in self._table_files()
 
     def save(self) -> None:
         assert self.metadata.short_name, "Missing dataset short_name"
@@ -150,11 +166,40 @@ class Dataset:
 
         self.metadata.save(self._index_file)
 
-        # Update the copy of this datasets metadata in every table in the set.
+        self._update_table_metadata()
+
+    def _update_table_metadata(self) -> None:
+        """
+        Update the copy of this dataset's metadata in every table in the set. Only the JSON
+        sidecars are touched, the table data is never read.
+        """
+        # serialise the dataset metadata the same way a table does, once for all tables
+        dataset_json = json.dumps(TableMeta(dataset=self.metadata).to_dict()["dataset"], indent=2, default=str)
+        dataset_metadata = json.loads(dataset_json)
+
         for table_name in self.table_names:
-            table = self[table_name]
-            table.metadata.dataset = self.metadata
-            table._save_metadata(join(self.path, table.metadata.checked_name + ".meta.json"))
+            with open(join(self.path, table_name + ".meta.json"), "rb") as istream:
+                old_contents = istream.read()
+
+            metadata = json.loads(old_contents)
+            metadata["dataset"] = dataset_metadata
+            if not metadata.get("short_name"):
+                raise Exception("table has no short_name")
+
+            # the pure python encoder json uses for indented output is slow, so rather than
+            # encoding the whole document again just swap in the new dataset metadata
+            contents = _replace_dataset_json(old_contents, dataset_json)
+            if contents is None or json.loads(contents) != metadata:
+                contents = json.dumps(metadata, indent=2, default=str).encode()
+
+            filename = join(self.path, metadata["short_name"] + ".meta.json")
+            if filename == join(self.path, table_name + ".meta.json") and contents == old_contents:
+                continue
+
+            # write atomically, so an interrupted save never leaves a truncated file
+            with open(filename + ".tmp", "wb") as ostream:
+                ostream.write(contents)
+            os.replace(filename + ".tmp", filename)
 
     def update_metadata(self, metadata_path: Path, if_source_exists: SOURCE_EXISTS_OPTIONS = "replace") -> None:
         """
@@ -167,48 +212,67 @@ class Dataset:
             - "append": append new source to existing ones
             - "fail": raise an exception if source already exists
         """
-        self.metadata.update_from_yaml(metadata_path, if_source_exists=if_source_exists)
+        # parse the file once and share it between the dataset and all its tables
+        metadata = _load_yaml(metadata_path)
 
-        with open(metadata_path) as istream:
-            metadata = yaml.safe_load(istream)
-            for table_name in metadata.get("tables", {}).keys():
-                table = self[table_name]
-                table.update_metadata_from_yaml(metadata_path, table_name)
-                table._save_metadata(join(self.path, table.metadata.checked_name + ".meta.json"))
+        self.metadata.update_from_dict(metadata, if_source_exists=if_source_exists)
+
+        for table_name in metadata.get("tables", {}).keys():
+            table = self[table_name]
+            table.update_metadata_from_dict(metadata, table_name)
+            table._save_metadata(join(self.path, table.metadata.checked_name + ".meta.json"))
 
     def index(self, catalog_path: Path = Path("/")) -> pd.DataFrame:
         """
         Return a DataFrame describing the contents of this dataset, one row per table.
         """
-        base = {
-            "namespace": self.metadata.namespace,
-            "dataset": self.metadata.short_name,
-            "version": self.metadata.version,
-            "checksum": self.checksum(),
-            "is_public": self.metadata.is_public,
-        }
-        rows = []
-        for metadata_file in self._metadata_files:
-            with open(metadata_file) as istream:
-                metadata = TableMeta.from_dict(json.load(istream))
-
-            row = base.copy()
-
-            assert metadata.short_name
-            row["table"] = metadata.short_name
+        return pd.DataFrame(self._index_columns(catalog_path))
 
-            row["dimensions"] = json.dumps(metadata.primary_key)
-
-            table_path = Path(self.path) / metadata.short_name
-            relative_path = table_path.relative_to(catalog_path)
-            row["path"] = relative_path.as_posix()
-            row["channel"] = relative_path.parts[0]
-
-            row["formats"] = [f for f in SUPPORTED_FORMATS if table_path.with_suffix(f".{f}").exists()]  # type: ignore
+    def _index_columns(self, catalog_path: Path = Path("/")) -> Dict[str, List[Any]]:
+        """
+        Same as `index()`, but as plain lists per column, so that a catalog can extend them
+        with the tables of many datasets and build a single frame from them.
+        """
+        tables: List[str] = []
+        dimensions: List[str] = []
+        paths: List[str] = []
+        formats: List[List[str]] = []
 
-            rows.append(row)
+        # every table lives straight in the dataset folder, so resolve its relative path once
+        dataset_path = Path(self.path).relative_to(catalog_path)
+        path_prefix = dataset_path.as_posix() + "/"
+        channel = dataset_path.parts[0]
 
-        return pd.DataFrame.from_records(rows)
+        file_names = set(self._file_names())
+        for metadata_file in self._metadata_files:
+            # we only need two fields, so skip building a full TableMeta
+            with open(metadata_file, "rb") as istream:
+                metadata = json.loads(istream.read())
+
+            short_name = metadata.get("short_name")
+            assert short_name
+            tables.append(short_name)
+
+            dimensions.append(json.dumps(metadata.get("primary_key", [])))
+
+            paths.append(path_prefix + short_name)
+
+            formats.append([f for f in SUPPORTED_FORMATS if f"{short_name}.{f}" in file_names])  # type: ignore
+
+        # the dataset fields are the same for every table
+        n = len(tables)
+        return {
+            "namespace": [self.metadata.namespace] * n,
+            "dataset": [self.metadata.short_name] * n,
+            "version": [self.metadata.version] * n,
+            "checksum": [self.checksum()] * n,
+            "is_public": [self.metadata.is_public] * n,
+            "table": tables,
+            "dimensions": dimensions,
+            "path": paths,
+            "channel": [channel] * n,
+            "formats": formats,
+        }
 
     @property
     def _index_file(self) -> str:
@@ -221,38 +285,88 @@ class Dataset:
         return len(self.table_names)
 
     def __iter__(self) -> Iterator[tables.Table]:
-        for name in self.table_names:
-            yield self[name]
+        # resolve every table's file from a single listing, rather than a lookup per name
+        table_files = self._table_files()
+        for name in sorted(table_files):
+            yield tables.Table.read(table_files[name])
+
+    def _file_names(self) -> List[str]:
+        """
+        Sorted names of the files in the dataset folder, from a single directory listing.
+        The listing is reused for as long as the folder is unchanged, judging by its inode and
+        timestamps, and only once it was made well after the folder last changed.
+        """
+        stat = os.stat(self.path)
+        key = (stat.st_ino, stat.st_mtime_ns, stat.st_ctime_ns)
+        if self._listing is None or self._listing[0] != key or not _settled(stat, self._listing[1]):
+            listed_at = time.time_ns()
+            with os.scandir(self.path) as entries:
+                # skip hidden files, like glob does
+                names = sorted(entry.name for entry in entries if not entry.name.startswith("."))
+
+            # the file to read for each table, in order of format preference
+            table_files: Dict[str, str] = {}
+            for format in SUPPORTED_FORMATS:
+                suffix = f".{format}"
+                for name in names:
+                    if name.endswith(suffix):
+                        table_files.setdefault(name[: -len(suffix)], join(self.path, name))
+
+            self._listing = (key, listed_at, names, table_files)
+
+        return self._listing[2]
+
+    def _table_files(self) -> Dict[str, str]:
+        """Map each table name to the file it is read from."""
+        self._file_names()
+        return cast(Tuple[Tuple[int, int, int], int, List[str], Dict[str, str]], self._listing)[3]
 
     @property
     def _data_files(self) -> List[str]:
-        files = []
-        for format in SUPPORTED_FORMATS:
-            pattern = join(self.path, f"*.{format}")
-            files.extend(glob(pattern))
-
-        return sorted(files)
+        suffixes = tuple(f".{format}" for format in SUPPORTED_FORMATS)
+        return [join(self.path, name) for name in self._file_names() if name.endswith(suffixes)]
 
     @property
     def table_names(self) -> List[str]:
-        return sorted(set(Path(f).stem for f in self._data_files))
+        return sorted(self._table_files())
 
     @property
     def _metadata_files(self) -> List[str]:
-        return sorted(glob(join(self.path, "*.meta.json")))
+        return [join(self.path, name) for name in self._file_names() if name.endswith(".meta.json")]
 
     def checksum(self) -> str:
         "Return a MD5 checksum of all data and metadata in the dataset."
-        _hash = hashlib.md5()
-        _hash.update(checksum_file(self._index_file).digest())
-
+        filenames = [self._index_file]
         for data_file in self._data_files:
-            _hash.update(checksum_file(data_file).digest())
+            filenames.append(data_file)
+            filenames.append(Path(data_file).with_suffix(".meta.json").as_posix())
+
+        # nothing changed since we last hashed these files, so neither can the checksum
+        hashed_at = time.time_ns()
+        stats = [os.stat(f) for f in filenames]
+        signature = tuple((f, s.st_mtime_ns, s.st_ctime_ns, s.st_size, s.st_ino) for f, s in zip(filenames, stats))
+        if self._checksum_cache is not None and self._checksum_cache[0] == signature:
+            return self._checksum_cache[1]
+
+        # hashing is mostly waiting on reads, so overlap them; map keeps the order stable.
+        # Keep the pool small, since reindex already runs many of these side by side
+        if len(filenames) > 3:
+            with ThreadPoolExecutor(max_workers=min(CHECKSUM_WORKERS, len(filenames))) as executor:
+                digests = list(executor.map(lambda f: checksum_file(f).digest(), filenames))
+        else:
+            digests = [checksum_file(f).digest() for f in filenames]
 
-            metadata_file = Path(data_file).with_suffix(".meta.json").as_posix()
-            _hash.update(checksum_file(metadata_file).digest())
+        # same bytes as feeding the digests one by one, in a single update
+        _hash = hashlib.md5(b"".join(digests))
 
-        return _hash.hexdigest()
+        # a file rewritten within the same timestamp tick would keep its signature, so only
+        # remember checksums of files that had settled by the time we hashed them
+        checksum = _hash.hexdigest()
+        if all(_settled(s, hashed_at) for s in stats):
+            self._checksum_cache = (signature, checksum)
+        else:
+            self._checksum_cache = None
+        return checksum
 
 
 for k in DatasetMeta.__dataclass_fields__:
@@ -262,14 +376,60 @@ for k in DatasetMeta.__dataclass_fields__:
     setattr(Dataset, k, metadata_property(k))
 
 
+def _replace_dataset_json(contents: bytes, dataset_json: str) -> Optional[bytes]:
+    """
+    Replace the value of the top-level "dataset" key in a sidecar written with
+    `json.dumps(..., indent=2)`. Top-level keys and the closing brace of their values are
+    the only lines indented by exactly two spaces, and JSON strings never contain raw
+    newlines, so the value can be found without parsing. Returns None if the document
+    doesn't have that shape.
+    """
+    key = b'\n  "dataset": '
+    start = contents.find(key)
+    if start == -1:
+        return None
+
+    start += len(key)
+    if contents.startswith(b"{}", start):
+        end = start + 2
+    elif contents.startswith(b"{\n", start):
+        end = contents.find(b"\n  }", start)
+        if end == -1:
+            return None
+        end += 4
+    else:
+        return None
+
+    # nest the dataset one level deeper, like it is in the document
+    return contents[:start] + dataset_json.replace("\n", "\n  ").encode() + contents[end:]
+
+
+# read buffers for checksum_file, one per thread so that concurrent checksums don't share one
+_checksum_buffers = threading.local()
+
+
+def _settled(stat: os.stat_result, when_ns: int) -> bool:
+    """Whether a file had last changed well before `when_ns`, beyond the timestamp granularity."""
+    return when_ns - max(stat.st_mtime_ns, stat.st_ctime_ns) >= TIMESTAMP_GRANULARITY_NS
+
+
 def checksum_file(filename: str) -> Any:
     "Return the MD5 checksum of a given file."
-    chunk_size = 2**20  # 1MB
-    checksum = hashlib.md5()
-    with open(filename, "rb") as istream:
-        chunk = istream.read(chunk_size)
-        while chunk:
-            checksum.update(chunk)
-            chunk = istream.read(chunk_size)
+    chunk_size = 2**23  # 8MB
+    # unbuffered, so reads go straight into our buffer without an extra copy
+    with open(filename, "rb", buffering=0) as istream:
+        # python 3.11+ reads into a single reusable buffer rather than a new one per chunk
+        if hasattr(hashlib, "file_digest"):
+            return hashlib.file_digest(istream, "md5")  # type: ignore
+
+        checksum = hashlib.md5()
+        if not hasattr(_checksum_buffers, "buffer"):
+            _checksum_buffers.buffer = bytearray(chunk_size)
+            _checksum_buffers.view = memoryview(_checksum_buffers.buffer)
+        buffer, view = _checksum_buffers.buffer, _checksum_buffers.view
+        size = istream.readinto(buffer)
+        while size:
+            checksum.update(view[:size])
+            size = istream.readinto(buffer)
 
     return checksum
@@ -0,0 +1,170 @@
+#
+#  http.py
+#  owid-catalog-py
+#
+#  Reading remote files over HTTP, through a shared keep-alive session, with local copies
+#  and in-memory bodies revalidated against their ETag / Last-Modified headers.
+#
+
+import contextlib
+import hashlib
+import json
+import os
+import tempfile
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Tuple, Union
+from urllib.parse import urlparse
+
+import requests
+import structlog
+
+log = structlog.get_logger()
+
+# where we keep local copies of remote files, e.g. catalog indexes
+CACHE_DIR = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "owid-catalog"
+
+# increment this when the layout of the cache changes, so old copies are left alone
+CACHE_VERSION = 3
+
+# one session for all remote requests, so connections are kept alive between them
+SESSION = requests.Session()
+for _prefix in ("http://", "https://"):
+    SESSION.mount(_prefix, requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=8))
+
+# seconds to wait for the server to connect or send data
+HTTP_TIMEOUT = 30
+
+# small remote files fetched in this process, by uri, with their ETag / Last-Modified headers
+_FETCHED: "OrderedDict[str, Tuple[Dict[str, str], bytes]]" = OrderedDict()
+
+# how many of them to remember, see `fetch_revalidated`
+FETCHED_CACHE_SIZE = 256
+
+
+def cached_download(uri: str) -> Union[str, Path]:
+    """
+    Keep a local copy of a remote file, revalidating it against its ETag / Last-Modified
+    headers so that unchanged files are not downloaded again. Local paths are returned as is,
+    and so are URLs if there is no writable cache directory, so that they get read directly.
+    """
+    if not uri.startswith("http"):
+        return uri
+
+    ext = os.path.splitext(urlparse(uri).path)[1]
+    cache_file = CACHE_DIR / f"v{CACHE_VERSION}" / (hashlib.sha1(uri.encode()).hexdigest() + ext)
+    headers_file = cache_file.parent / (cache_file.name + ".headers.json")
+
+    headers = {}
+    for k, v in _cached_validators(cache_file, headers_file).items():
+        headers["If-None-Match" if k == "ETag" else "If-Modified-Since"] = v
+
+    # the session asks for gzip and decodes it transparently if the server supports it;
+    # closing the response hands its connection back to the session's pool
+    with SESSION.get(uri, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as resp:
+        if resp.status_code == 304:
+            return cache_file
+        resp.raise_for_status()
+
+        try:
+            cache_file.parent.mkdir(parents=True, exist_ok=True)
+            ostream = tempfile.NamedTemporaryFile(dir=cache_file.parent, delete=False)
+        except OSError as e:
+            # e.g. a read-only home directory in a container, read from the url instead
+            log.warning("cache.unavailable", path=str(cache_file.parent), error=str(e))
+            return uri
+
+        # write atomically so that an interrupted download never leaves a broken file behind
+        try:
+            with ostream:
+                for chunk in resp.iter_content(chunk_size=2**20):
+                    ostream.write(chunk)
+
+            # the validators record which body they belong to, so that a crash or a concurrent
+            # download between the two replaces can't pair a body with another one's ETag
+            stat = os.stat(ostream.name)
+            validators = {k: resp.headers[k] for k in ("ETag", "Last-Modified") if k in resp.headers}
+            _write_atomically(
+                headers_file,
+                json.dumps({**validators, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns}).encode(),
+            )
+            os.replace(ostream.name, cache_file)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(ostream.name)
+            raise
+
+    return cache_file
+
+
+def fetch(uri: str) -> bytes:
+    """Download a remote file into memory."""
+    with SESSION.get(uri, timeout=HTTP_TIMEOUT) as resp:
+        resp.raise_for_status()
+        return resp.content
+
+
+def fetch_revalidated(uri: str) -> bytes:
+    """
+    Download a small remote file, remembering it in memory and revalidating it with a
+    conditional request when it is fetched again, so that an unchanged file costs a 304.
+    """
+    validators, body = _FETCHED.get(uri, ({}, b""))
+    headers = {"If-None-Match" if k == "ETag" else "If-Modified-Since": v for k, v in validators.items()}
+
+    with SESSION.get(uri, headers=headers, timeout=HTTP_TIMEOUT) as resp:
+        if resp.status_code == 304 and uri in _FETCHED:
+            _FETCHED.move_to_end(uri)
+            return body
+        resp.raise_for_status()
+        body = resp.content
+        validators = {k: resp.headers[k] for k in ("ETag", "Last-Modified") if k in resp.headers}
+
+    # without validators there is nothing to revalidate against
+    if validators:
+        _FETCHED[uri] = (validators, body)
+        _FETCHED.move_to_end(uri)
+        if len(_FETCHED) > FETCHED_CACHE_SIZE:
+            _FETCHED.popitem(last=False)
+
+    return body
+
+
+def read_bytes(path: Union[str, Path]) -> bytes:
+    """Contents of a file as returned by `cached_download`, which may still be a URL."""
+    if str(path).startswith("http"):
+        return fetch(str(path))
+
+    with open(path, "rb") as istream:
+        return istream.read()
+
+
+def _cached_validators(cache_file: Path, headers_file: Path) -> Dict[str, str]:
+    """
+    ETag / Last-Modified headers of a cached file, or nothing if they are missing or were
+    recorded for a different body than the one in the cache.
+    """
+    try:
+        with open(headers_file, "rb") as istream:
+            cached = json.loads(istream.read())
+        stat = os.stat(cache_file)
+    except (OSError, ValueError):
+        return {}
+
+    if cached.get("size") != stat.st_size or cached.get("mtime_ns") != stat.st_mtime_ns:
+        return {}
+
+    return {k: cached[k] for k in ("ETag", "Last-Modified") if k in cached}
+
+
+def _write_atomically(path: Path, contents: bytes) -> None:
+    """Write a file through a temporary one, so readers see either the old or new contents."""
+    ostream = tempfile.NamedTemporaryFile(dir=path.parent, delete=False)
+    try:
+        with ostream:
+            ostream.write(contents)
+        os.replace(ostream.name, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(ostream.name)
+        raise
@@ -14,14 +14,29 @@ from dataclasses_json import dataclass_json
 
 T = TypeVar("T")
 
+# the C parser is many times faster, but is only there if PyYAML was built against LibYAML
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
+
+def _load_yaml(path: Union[Path, str]) -> Any:
+    """Same as `yaml.safe_load` on the file's contents, using the C parser when available."""
+    with open(path) as istream:
+        return yaml.load(istream.read(), Loader=_YAML_LOADER)
+
+
+def _keep_field(k: str, v: Any) -> bool:
+    # only keep non-null public variables; the same test as `v not in [None, [], {}]`,
+    # without building a list and comparing against each of its items for every field
+    return not k.startswith("_") and v is not None and not (isinstance(v, (list, dict)) and not v)
+
 
 def pruned_json(cls: T) -> T:
     orig = cls.to_dict  # type: ignore
 
-    # only keep non-null public variables
-    cls.to_dict = lambda self, **kwargs: {  # type: ignore
-        k: v for k, v in orig(self, **kwargs).items() if not k.startswith("_") and v not in [None, [], {}]
-    }
+    def to_dict(self: Any, **kwargs: Any) -> Dict[str, Any]:
+        return {k: v for k, v in orig(self, **kwargs).items() if _keep_field(k, v)}
+
+    cls.to_dict = to_dict  # type: ignore
 
     return cls
 
@@ -155,13 +170,15 @@ class DatasetMeta:
 
     def save(self, filename: Union[str, Path]) -> None:
         filename = Path(filename).as_posix()
+        # encode in one go and write once, json.dump would write every token separately
+        contents = json.dumps(self.to_dict(), indent=2, default=str)
         with open(filename, "w") as ostream:
-            json.dump(self.to_dict(), ostream, indent=2, default=str)
+            ostream.write(contents)
 
     @classmethod
     def load(cls, filename: str) -> "DatasetMeta":
-        with open(filename) as istream:
-            return cls.from_dict(json.load(istream))
+        with open(filename, "rb") as istream:
+            return cls.from_dict(json.loads(istream.read()))
 
     def to_dict(self) -> Dict[str, Any]:
         ...
@@ -172,9 +189,12 @@ class DatasetMeta:
 
     def update_from_yaml(self, path: Union[Path, str], if_source_exists: SOURCE_EXISTS_OPTIONS = "fail") -> None:
         """The main reason for wanting to do this is to manually override what goes into Grapher before an export."""
-        with open(path) as istream:
-            annot = yaml.safe_load(istream)
+        annot = _load_yaml(path)
+
+        self.update_from_dict(annot, if_source_exists=if_source_exists)
 
+    def update_from_dict(self, annot: Dict[str, Any], if_source_exists: SOURCE_EXISTS_OPTIONS = "fail") -> None:
+        """Same as `update_from_yaml`, but from an already parsed metadata document."""
         dataset_sources = annot.get("dataset", {}).get("sources", []) or []
 
         # update sources of dataset, if there are no sources in the new dataset, don't update existing ones
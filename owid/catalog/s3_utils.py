@@ -2,13 +2,15 @@
 It would make sense to move both into a shared module in the future or use some proper public library
 for working with S3 that is compatible with DigitalOcean's Spaces.
 """
+import io
 import logging
 import os
 from os import path
-from typing import Any, Tuple
+from typing import Any, Optional, Tuple
 from urllib.parse import urlparse
 
 import boto3
+from boto3.s3.transfer import TransferConfig
 from botocore.exceptions import ClientError
 
 SPACES_ENDPOINT = "https://nyc3.digitaloceanspaces.com"
@@ -16,6 +18,17 @@ S3_BASE = "s3://walden.nyc3.digitaloceanspaces.com"
 HTTPS_BASE = "https://walden.nyc3.digitaloceanspaces.com"
 AWS_PROFILE = os.environ.get("AWS_PROFILE", "default")
 
+# creating a client is slow, so we keep the first one around (boto3 clients are thread-safe)
+_CLIENT: Optional[Any] = None
+
+# fetch large files as several byte ranges in parallel
+TRANSFER_CONFIG = TransferConfig(
+    multipart_threshold=8 * 1024 * 1024,
+    multipart_chunksize=8 * 1024 * 1024,
+    max_concurrency=8,
+    use_threads=True,
+)
+
 
 def upload(filename: str, relative_path: str, public: bool = False) -> str:
     """
@@ -61,7 +74,7 @@ def download(s3_url: str, filename: str, quiet: bool = False) -> None:
     bucket, key = s3_bucket_key(s3_url)
 
     try:
-        client.download_file(bucket, key, filename)
+        client.download_file(bucket, key, filename, Config=TRANSFER_CONFIG)
     except ClientError as e:
         logging.error(e)
         raise UploadError(e)
@@ -70,16 +83,39 @@ def download(s3_url: str, filename: str, quiet: bool = False) -> None:
         logging.info("DOWNLOADED", f"{s3_url} -> {filename}")
 
 
+def download_to_buffer(s3_url: str, quiet: bool = False) -> bytes:
+    """Download the file at the S3 URL into memory and return its contents."""
+    client = connect()
+
+    bucket, key = s3_bucket_key(s3_url)
+
+    buffer = io.BytesIO()
+    try:
+        client.download_fileobj(bucket, key, buffer, Config=TRANSFER_CONFIG)
+    except ClientError as e:
+        logging.error(e)
+        raise UploadError(e)
+
+    if not quiet:
+        logging.info("DOWNLOADED", f"{s3_url} -> memory")
+
+    return buffer.getvalue()
+
+
 def connect() -> Any:
     "Return a connection to Walden's DigitalOcean space."
-    check_for_default_profile()
-
-    session = boto3.Session(profile_name=AWS_PROFILE)
-    client = session.client(
-        service_name="s3",
-        endpoint_url=SPACES_ENDPOINT,
-    )
-    return client
+    global _CLIENT
+
+    if _CLIENT is None:
+        check_for_default_profile()
+
+        session = boto3.Session(profile_name=AWS_PROFILE)
+        _CLIENT = session.client(
+            service_name="s3",
+            endpoint_url=SPACES_ENDPOINT,
+        )
+
+    return _CLIENT
 
 
 def check_for_default_profile() -> None:
@@ -6,26 +6,29 @@ import copy
 import dataclasses
 import json
 from collections import defaultdict
-from os.path import dirname, join, splitext
+from os.path import splitext
 from pathlib import Path
 from typing import Any, Dict, List, Literal, Optional, Union, cast, overload
 
 import pandas as pd
 import pyarrow
+import pyarrow.feather as feather
 import pyarrow.parquet as pq
-import requests
 import structlog
-import yaml
 from owid.repack import repack_frame
 from pandas.util._decorators import rewrite_axis_style_signature
 
-from . import variables
-from .meta import Source, TableMeta, VariableMeta
+from . import http, variables
+from .meta import Source, TableMeta, VariableMeta, _keep_field, _load_yaml
 
 log = structlog.get_logger()
 
-SCHEMA = json.load(open(join(dirname(__file__), "schemas", "table.json")))
-METADATA_FIELDS = list(SCHEMA["properties"])
+# bytes to collect before writing to a parquet file
+WRITE_BUFFER_SIZE = 4 * 1024 * 1024
+
+# the same schema is already loaded by variables, no need to read and parse it twice
+SCHEMA = variables.SCHEMA
+METADATA_FIELDS = variables.METADATA_FIELDS
 
 
 class Table(pd.DataFrame):
@@ -120,18 +123,24 @@ class Table(pd.DataFrame):
             raise ValueError(f"could not detect a suitable format to save to: {path}")
 
     @classmethod
-    def read(cls, path: Union[str, Path]) -> "Table":
+    def read(cls, path: Union[str, Path], cache: bool = False) -> "Table":
+        """
+        Read a table saved in one of our SUPPORTED_FORMATS.
+
+        :param cache: Keep a local copy of remote files, revalidated with conditional requests,
+            so that reading an unchanged file again doesn't download it again
+        """
         if isinstance(path, Path):
             path = path.as_posix()
 
         if path.endswith(".csv"):
-            return cls.read_csv(path)
+            return cls.read_csv(path, cache=cache)
 
         elif path.endswith(".feather"):
-            return cls.read_feather(path)
+            return cls.read_feather(path, cache=cache)
 
         elif path.endswith(".parquet"):
-            return cls.read_parquet(path)
+            return cls.read_parquet(path, cache=cache)
 
         raise ValueError(f"could not detect a suitable format to read from: {path}")
 
@@ -158,22 +167,29 @@ class Table(pd.DataFrame):
         path: Any,
         repack: bool = True,
         compression: Literal["zstd", "lz4", "uncompressed"] = "zstd",
+        compression_level: Optional[int] = None,
+        chunksize: Optional[int] = None,
         **kwargs: Any,
     ) -> None:
         """
         Save this table as a feather file plus accompanying JSON metadata file.
         If the table is stored at "mytable.feather", the metadata will be at
         "mytable.meta.json".
+
+        :param compression_level: Level for the codec, pyarrow's default if not given
+        :param chunksize: Rows per record batch, pyarrow's default (64K rows) if not given
         """
         if not isinstance(path, str) or not path.endswith(".feather"):
             raise ValueError(f'filename must end in ".feather": {path}')
 
         # feather can't store the index
         df = pd.DataFrame(self)
-        if self.primary_key:
-            overlapping_names = set(self.index.names) & set(self.columns)
-            if overlapping_names:
-                raise ValueError(f"index names are overlapping with column names: {overlapping_names}")
+        primary_key = self.primary_key
+        if primary_key:
+            # look the few index names up in the columns' own hash table
+            overlapping_names = self.columns.intersection(primary_key)
+            if len(overlapping_names):
+                raise ValueError(f"index names are overlapping with column names: {set(overlapping_names)}")
             df = df.reset_index()
 
         if repack:
@@ -181,17 +197,28 @@ class Table(pd.DataFrame):
             # NOTE: this can be slow for large dataframes
             df = repack_frame(df)
 
-        df.to_feather(path, compression=compression, **kwargs)
+        df.to_feather(path, compression=compression, compression_level=compression_level, chunksize=chunksize, **kwargs)
 
         self._save_metadata(self.metadata_filename(path))
 
     def metadata_filename(self, path: str):
         return splitext(path)[0] + ".meta.json"
 
-    def to_parquet(self, path: Any, repack: bool = True) -> None:  # type: ignore
+    def to_parquet(  # type: ignore
+        self,
+        path: Any,
+        repack: bool = True,
+        compression: Literal["zstd", "snappy", "gzip", "brotli", "lz4", "none"] = "zstd",
+        compression_level: Optional[int] = None,
+        **kwargs: Any,
+    ) -> None:
         """
         Save this table as a parquet file with embedded metadata in the table schema.
 
+        Files are compressed with zstd (level 3 unless given) rather than pyarrow's default
+        snappy, which makes them both smaller and faster to read. Extra arguments are passed
+        to `pq.write_table`.
+
         NOTE: we save the metadata for fields in the table scheme, but it might be
               possible with Parquet to store it in the fields themselves somehow
         """
@@ -224,20 +251,34 @@ class Table(pd.DataFrame):
         # t = t.cast(schema)
 
         # write the combined table to disk
-        pq.write_table(t, path)
+        if compression == "zstd" and compression_level is None:
+            compression_level = 3
+        if "://" in path:
+            # e.g. s3:// or other URIs, which pyarrow resolves to a filesystem itself
+            pq.write_table(t, path, compression=compression, compression_level=compression_level, **kwargs)
+        else:
+            # the writer issues a write per page and column chunk, so batch them up before they
+            # hit the file; this helps wide tables that only have a few rows per column
+            with pyarrow.OSFile(path, "wb") as raw, pyarrow.BufferedOutputStream(raw, WRITE_BUFFER_SIZE) as sink:
+                pq.write_table(t, sink, compression=compression, compression_level=compression_level, **kwargs)
 
         self._save_metadata(self.metadata_filename(path))
 
     def _save_metadata(self, filename: str) -> None:
-        # write metadata
-        with open(filename, "w") as ostream:
-            metadata = self.metadata.to_dict()  # type: ignore
-            metadata["primary_key"] = self.primary_key
-            metadata["fields"] = self._get_fields_as_dict()
-            json.dump(metadata, ostream, indent=2, default=str)
+        # write metadata, encoded in one go since json.dump would write every token separately
+        metadata = self.metadata.to_dict()  # type: ignore
+        metadata["primary_key"] = self.primary_key
+        # fields are serialised straight from their VariableMeta, see `_json_default`
+        metadata["fields"] = {col: self._fields[col] for col in self.all_columns}
+        contents = json.dumps(metadata, indent=2, default=_json_default)
+
+        # json.dumps escapes anything outside ASCII, so the bytes can be written as they are,
+        # skipping the text layer (and its newline translation on Windows)
+        with open(filename, "wb") as ostream:
+            ostream.write(contents.encode("ascii"))
 
     @classmethod
-    def read_csv(cls, path: Union[str, Path]) -> "Table":
+    def read_csv(cls, path: Union[str, Path], cache: bool = False) -> "Table":
         """
         Read the table from csv plus accompanying JSON sidecar.
         """
@@ -247,28 +288,20 @@ class Table(pd.DataFrame):
         if not path.endswith(".csv"):
             raise ValueError(f'filename must end in ".csv": {path}')
 
-        # load the data
-        df = Table(pd.read_csv(path, index_col=False, na_values=[""], keep_default_na=False))
-
-        # load the metadata
-        metadata = cls._read_metadata(path)
-
-        primary_key = metadata.pop("primary_key") if "primary_key" in metadata else []
-        fields = metadata.pop("fields") if "fields" in metadata else {}
-
-        df.metadata = TableMeta(**metadata)
-        df._fields = defaultdict(VariableMeta, {k: VariableMeta.from_dict(v) for k, v in fields.items()})
-
-        if primary_key:
-            df.set_index(primary_key, inplace=True)
-
+        # load the data and add metadata
+        data_path = cls._local_copy(path) if cache else path
+        df = Table(pd.read_csv(data_path, index_col=False, na_values=[""], keep_default_na=False))
+        cls._add_metadata(df, path, cache=cache)
         return df
 
     @classmethod
-    def _add_metadata(cls, df: pd.DataFrame, path: str) -> None:
+    def _add_metadata(cls, df: pd.DataFrame, path: str, cache: bool = False) -> None:
         """Read metadata from JSON sidecar and add it to the dataframe."""
-        metadata = cls._read_metadata(path)
+        cls._add_metadata_from_dict(df, cls._read_metadata(path, cache=cache))
 
+    @classmethod
+    def _add_metadata_from_dict(cls, df: pd.DataFrame, metadata: Dict[str, Any]) -> None:
+        """Add metadata, as found in a JSON sidecar, to the dataframe."""
         primary_key = metadata.get("primary_key", [])
         fields = metadata.pop("fields") if "fields" in metadata else {}
 
@@ -279,11 +312,13 @@ class Table(pd.DataFrame):
             df.set_index(primary_key, inplace=True)
 
     @classmethod
-    def read_feather(cls, path: Union[str, Path]) -> "Table":
+    def read_feather(cls, path: Union[str, Path], cache: bool = False) -> "Table":
         """
         Read the table from feather plus accompanying JSON sidecar.
 
         The path may be a local file path or a URL.
+
+        :param cache: Keep a local copy of remote files, see `Table.read`
         """
         if isinstance(path, Path):
             path = path.as_posix()
@@ -292,16 +327,24 @@ class Table(pd.DataFrame):
             raise ValueError(f'filename must end in ".feather": {path}')
 
         # load the data and add metadata
-        df = Table(pd.read_feather(path))
-        cls._add_metadata(df, path)
+        data_path = cls._local_copy(path) if cache else path
+        if data_path.startswith("http"):
+            df = Table(pd.read_feather(data_path))
+        else:
+            # map the file rather than reading it into a buffer first
+            t = feather.read_table(data_path, memory_map=True)
+            df = Table(t.to_pandas(use_threads=True, split_blocks=True, self_destruct=True))
+        cls._add_metadata(df, path, cache=cache)
         return df
 
     @classmethod
-    def read_parquet(cls, path: Union[str, Path]) -> "Table":
+    def read_parquet(cls, path: Union[str, Path], cache: bool = False) -> "Table":
         """
         Read the table from a parquet file plus accompanying JSON sidecar.
 
         The path may be a local file path or a URL.
+
+        :param cache: Keep a local copy of remote files, see `Table.read`
         """
         if isinstance(path, Path):
             path = path.as_posix()
@@ -310,8 +353,14 @@ class Table(pd.DataFrame):
             raise ValueError(f'filename must end in ".parquet": {path}')
 
         # load the data and add metadata
-        df = Table(pd.read_parquet(path))
-        cls._add_metadata(df, path)
+        data_path = cls._local_copy(path) if cache else path
+        if data_path.startswith("http"):
+            df = Table(pd.read_parquet(data_path))
+        else:
+            # decode columns in parallel, and let arrow free its buffers as pandas takes them over
+            t = pq.read_table(data_path, use_threads=True)
+            df = Table(t.to_pandas(use_threads=True, split_blocks=True, self_destruct=True))
+        cls._add_metadata(df, path, cache=cache)
         return df
 
     def _get_fields_as_dict(self) -> Dict[str, Any]:
@@ -321,14 +370,28 @@ class Table(pd.DataFrame):
         self._fields = defaultdict(VariableMeta, {k: VariableMeta.from_dict(v) for k, v in fields.items()})
 
     @staticmethod
-    def _read_metadata(data_path: str) -> Dict[str, Any]:
+    def _local_copy(path: str) -> str:
+        """
+        Local copy of a remote file, revalidated with conditional requests over a shared
+        keep-alive connection; local paths are returned as is.
+        """
+        return str(http.cached_download(path))
+
+    @staticmethod
+    def _read_metadata(data_path: str, cache: bool = False) -> Dict[str, Any]:
         metadata_path = splitext(data_path)[0] + ".meta.json"
 
         if metadata_path.startswith("http"):
-            return cast(Dict[str, Any], requests.get(metadata_path).json())
+            # sidecars are only kept on disk if asked to, otherwise they are remembered in
+            # memory for this process, either way an unchanged one only costs a 304
+            if cache:
+                contents = http.read_bytes(Table._local_copy(metadata_path))
+            else:
+                contents = http.fetch_revalidated(metadata_path)
+            return cast(Dict[str, Any], json.loads(contents))
 
-        with open(metadata_path, "r") as istream:
-            return cast(Dict[str, Any], json.load(istream))
+        with open(metadata_path, "rb") as istream:
+            return cast(Dict[str, Any], json.loads(istream.read()))
 
     def __setitem__(self, key: Any, value: Any) -> Any:
         super().__setitem__(key, value)
@@ -344,7 +407,30 @@ class Table(pd.DataFrame):
                 self._fields[key] = VariableMeta()
 
     def equals_table(self, rhs: "Table") -> bool:
-        return isinstance(rhs, Table) and self.metadata == rhs.metadata and self.to_dict() == rhs.to_dict()
+        if not isinstance(rhs, Table) or self.metadata != rhs.metadata or self.shape != rhs.shape:
+            return False
+
+        # compare the underlying arrays rather than building a dict per column; like comparing
+        # `to_dict()`, this ignores the order of rows and columns and the dtypes of the values
+        try:
+            pd.testing.assert_frame_equal(
+                self,
+                rhs,
+                check_dtype=False,
+                check_index_type=False,
+                check_column_type=False,
+                check_categorical=False,
+                check_names=False,
+                check_exact=True,
+                check_like=True,
+            )
+        except AssertionError:
+            return False
+        except ValueError:
+            # rows can't be aligned when the index has duplicates
+            return self.to_dict() == rhs.to_dict()
+
+        return True
 
     @rewrite_axis_style_signature(
         "mapper",
@@ -359,13 +445,14 @@ class Table(pd.DataFrame):
         if inplace:
             new_table = self
 
-        # construct new _fields attribute
-        fields = {
-            new_col: self._fields[old_col] if inplace
-            # avoid deepcopy if inplace to make it faster
-            else copy.deepcopy(self._fields[old_col])
-            for old_col, new_col in zip(old_cols, new_table.all_columns)
-        }
+        # construct new _fields attribute, copying metadata unless renaming in place
+        if inplace:
+            fields = {new_col: self._fields[old_col] for old_col, new_col in zip(old_cols, new_table.all_columns)}
+        else:
+            fields = {
+                new_col: _copy_variable_meta(self._fields[old_col])
+                for old_col, new_col in zip(old_cols, new_table.all_columns)
+            }
 
         new_table._fields = defaultdict(VariableMeta, fields)
 
@@ -377,8 +464,7 @@ class Table(pd.DataFrame):
     @property
     def all_columns(self) -> List[str]:
         "Return names of all columns in the dataset, including the index."
-        combined: List[str] = filter(None, list(self.index.names) + list(self.columns))  # type: ignore
-        return combined
+        return [name for names in (self.index.names, self.columns) for name in names if name]
 
     def update_metadata_from_yaml(
         self, path: Union[Path, str], table_name: str, extra_variables: Literal["raise", "ignore"] = "raise"
@@ -387,9 +473,17 @@ class Table(pd.DataFrame):
         :param path: Path to YAML file.
         :param table_name: Name of table, also updates this in the metadata.
         """
-        with open(path) as istream:
-            annot = yaml.safe_load(istream)
+        annot = _load_yaml(path)
 
+        self.update_metadata_from_dict(annot, table_name, extra_variables=extra_variables)
+
+    def update_metadata_from_dict(
+        self, annot: Dict[str, Any], table_name: str, extra_variables: Literal["raise", "ignore"] = "raise"
+    ) -> None:
+        """Same as `update_metadata_from_yaml`, but from an already parsed metadata document.
+        :param annot: Metadata document, with the table under `tables`.
+        :param table_name: Name of table, also updates this in the metadata.
+        """
         self.metadata.short_name = table_name
 
         t_annot = annot["tables"][table_name]
@@ -448,14 +542,12 @@ class Table(pd.DataFrame):
             if missing_columns:
                 log.warning(f"Missing columns in table: {missing_columns}")
 
-        # NOTE: copying with `dataclasses.replace` is much faster than `copy.deepcopy`
+        # NOTE: copying with `_copy_variable_meta` is much faster than `copy.deepcopy`
         new_fields = defaultdict(VariableMeta)
         for k in common_columns:
             # copy if we have metadata in the other table
             if k in table._fields:
-                v = table._fields[k]
-                new_fields[k] = dataclasses.replace(v)
-                new_fields[k].sources = [dataclasses.replace(s) for s in v.sources]
+                new_fields[k] = _copy_variable_meta(table._fields[k])
             # otherwise keep current metadata (if it exists)
             elif k in self._fields:
                 new_fields[k] = self._fields[k]
@@ -526,6 +618,35 @@ class Table(pd.DataFrame):
         # copy variables metadata from other table
         if isinstance(other, Table):
             for k, v in other._fields.items():
-                t._fields[k] = dataclasses.replace(v)
-                t._fields[k].sources = [dataclasses.replace(s) for s in v.sources]
+                t._fields[k] = _copy_variable_meta(v)
         return t  # type: ignore
+
+
+def _copy_variable_meta(meta: VariableMeta) -> VariableMeta:
+    """
+    Same as `copy.deepcopy(meta)`, but copying only the mutable fields we know of, which is
+    much faster than letting deepcopy inspect every value.
+    """
+    return dataclasses.replace(
+        meta,
+        sources=[dataclasses.replace(s) for s in meta.sources],
+        licenses=[dataclasses.replace(lic) for lic in meta.licenses],
+        display=copy.deepcopy(meta.display) if meta.display else meta.display,
+        additional_info=copy.deepcopy(meta.additional_info) if meta.additional_info else meta.additional_info,
+    )
+
+
+def _json_default(obj: Any) -> Any:
+    """
+    Encode metadata objects while writing a JSON sidecar. Gives the same document as
+    `VariableMeta.to_dict()`, without first building a deep copy of every column's
+    metadata as a dict. As in `to_dict()`, only the top level is pruned.
+    """
+    if isinstance(obj, VariableMeta):
+        values = ((f.name, getattr(obj, f.name)) for f in dataclasses.fields(obj))
+        return {k: v for k, v in values if _keep_field(k, v)}
+
+    if dataclasses.is_dataclass(obj):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+
+    return str(obj)
@@ -1,13 +1,20 @@
 import re
+from collections import defaultdict
+from functools import lru_cache
 from typing import List, Literal, Optional, overload
 
 import numpy as np
 import pandas as pd
 from unidecode import unidecode
 
+from .meta import VariableMeta
 from .tables import Table
 from .variables import Variable
 
+_MULTIPLE_UNDERSCORES = re.compile("__+")
+_LEADING_DIGIT = re.compile("^[0-9]")
+_SNAKE_CASE = re.compile("^[a-z_][a-z0-9_]*$")
+
 
 @overload
 def underscore(name: str, validate: bool = True) -> str:
@@ -27,8 +34,18 @@ def underscore(name: Optional[str], validate: bool = True) -> Optional[str]:
     if name is None:
         return None
 
-    orig_name = name
+    underscored = _underscore(name)
+
+    # make sure it's under_score now, if not then raise NameError
+    if validate:
+        validate_underscore(underscored, f"`{name}`")
+
+    return underscored
 
+
+# the same names keep coming up across tables, so remember the ones we've seen
+@lru_cache(maxsize=8192)
+def _underscore(name: str) -> str:
     name = (
         name.replace(" ", "_")
         .replace("-", "_")
@@ -80,7 +97,7 @@ def underscore(name: Optional[str], validate: bool = True) -> Optional[str]:
     name = name.replace("'", "")
 
     # shrink triple underscore
-    name = re.sub("__+", "__", name)
+    name = _MULTIPLE_UNDERSCORES.sub("__", name)
 
     # convert special characters to ASCII
     name = unidecode(name).lower()
@@ -89,13 +106,9 @@ def underscore(name: Optional[str], validate: bool = True) -> Optional[str]:
     name = name.strip("_")
 
     # if the first letter is number, prefix it with underscore
-    if re.match("^[0-9]", name):
+    if _LEADING_DIGIT.match(name):
         name = f"_{name}"
 
-    # make sure it's under_score now, if not then raise NameError
-    if validate:
-        validate_underscore(name, f"`{orig_name}`")
-
     return name
 
 
@@ -142,7 +155,11 @@ def underscore_table(
 
     columns_map = {c_old: c_new for c_old, c_new in zip(orig_cols, new_cols)}
     if inplace:
-        t.rename(columns=columns_map, inplace=True)
+        # relabel directly, rather than having `rename` map every label, and move the
+        # metadata over to the new names just like it does
+        old_names = t.all_columns
+        t.columns = new_cols
+        t._fields = defaultdict(VariableMeta, {new: t._fields[old] for old, new in zip(old_names, t.all_columns)})
     else:
         t = t.rename(columns=columns_map)
 
@@ -151,16 +168,17 @@ def underscore_table(
     t.metadata.short_name = underscore(t.metadata.short_name)
 
     # put original names as titles into metadata by default
+    # (straight from the metadata, without slicing out every column as a variable)
     for c_old, c_new in columns_map.items():
-        if t[c_new].metadata.title is None:
-            t[c_new].metadata.title = c_old
+        if t._fields[c_new].title is None:
+            t._fields[c_new].title = c_old
 
     return t
 
 
 def validate_underscore(name: Optional[str], object_name: str = "Name") -> None:
     """Raise error if name is not snake_case."""
-    if name is not None and not re.match("^[a-z_][a-z0-9_]*$", name):
+    if name is not None and not _SNAKE_CASE.match(name):
         raise NameError(f"{object_name} must be snake_case. Change `{name}` to `{underscore(name, validate=False)}`")
 
 
@@ -11,7 +11,8 @@ import pandas as pd
 from .meta import VariableMeta
 from .properties import metadata_property
 
-SCHEMA = json.load(open(path.join(path.dirname(__file__), "schemas", "table.json")))
+with open(path.join(path.dirname(__file__), "schemas", "table.json"), "rb") as istream:
+    SCHEMA = json.loads(istream.read())
 METADATA_FIELDS = list(SCHEMA["properties"])
 
 
@@ -2,16 +2,33 @@
 #  test_catalogs.py
 #
 
+import json
+import os
 import tempfile
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterable, Iterator, Optional
+from typing import Any, Dict, Iterable, Iterator, Optional
 
+import numpy as np
+import pandas as pd
 import pytest  # noqa
-
-from owid.catalog import CHANNEL, LocalCatalog, RemoteCatalog, Table, find
+from botocore.exceptions import ClientError
+
+from owid.catalog import (
+    CHANNEL,
+    LocalCatalog,
+    RemoteCatalog,
+    Table,
+    catalogs,
+    find,
+    http,
+    s3_utils,
+)
+from owid.catalog.catalogs import CatalogSeries
 
 from .test_datasets import create_temp_dataset
+from .test_http import FakeResponse
+from .test_tables import mock_table
 
 _catalog: Optional[RemoteCatalog] = None
 
@@ -57,6 +74,125 @@ def test_find_from_local_catalog():
         assert len(matches.dataset.unique()) == 3
 
 
+def test_rows_and_columns_keep_base_uri():
+    with mock_catalog(2) as catalog:
+        matches = catalog.find()
+        for picked in (matches.iloc[0], matches.loc[matches.index[0]], matches["table"]):
+            assert isinstance(picked, CatalogSeries)
+            assert picked._base_uri == catalog.frame._base_uri
+
+
+def test_find_table_by_substring():
+    with mock_catalog(3) as catalog:
+        table = catalog.frame.table.iloc[0]
+        matches = catalog.find(table=table[1:])
+        assert table in set(matches.table)
+
+
+def test_find_table_by_regex():
+    with mock_catalog(3) as catalog:
+        table = catalog.frame.table.iloc[0]
+        assert len(catalog.find(table=".*")) == len(catalog.frame)
+        assert set(catalog.find(table=f"^{table}$").table) == {table}
+
+        other = catalog.frame.table.iloc[-1]
+        assert set(catalog.find(table=f"^{table}$|^{other}$").table) == {table, other}
+
+
+def test_find_table_with_missing_names():
+    with mock_catalog(3) as catalog:
+        table = catalog.frame.table.iloc[0]
+        catalog.frame.loc[catalog.frame.index[1:], "table"] = None
+
+        matches = catalog.find(table=table)
+        assert list(matches.table) == [table]
+
+
+def test_repeated_find_reuses_results():
+    with mock_catalog(3) as catalog:
+        namespace = catalog.frame.namespace.iloc[0]
+        first = catalog.find(namespace=namespace)
+        assert len(catalog._column_arrays()["results"]) == 1
+
+        assert catalog.find(namespace=namespace).equals(first)
+        assert len(catalog._column_arrays()["results"]) == 1
+
+
+def test_find_follows_in_place_edits():
+    with mock_catalog(3) as catalog:
+        frame = catalog.frame
+        n = len(catalog.find(dataset="dataset1"))
+        assert n > 0
+        assert len(catalog.find(version="edited")) == 0
+
+        frame.loc[frame.dataset == "dataset1", "version"] = "edited"
+        assert len(catalog.find(version="edited")) == n
+
+        frame.drop(frame.index[frame.dataset == "dataset1"], inplace=True)
+        assert len(catalog.find(dataset="dataset1")) == 0
+        assert len(catalog.find(version="edited")) == 0
+        assert len(catalog.find(table=frame.table.iloc[-1])) > 0
+
+
+def test_table_name_index_is_built_on_demand():
+    with mock_catalog(3) as catalog:
+        catalog.find(dataset="dataset1")
+        assert "table_index" not in catalog._column_arrays()
+
+        catalog.find(table="a")
+        assert "table_index" in catalog._column_arrays()
+
+
+def test_find_by_categorical_columns():
+    with mock_catalog(3) as catalog:
+        # codes are only used for the lookup, users see plain values
+        assert catalog.frame.dataset.dtype == object
+        assert catalog.find(dataset="dataset1").dataset.dtype == object
+        assert isinstance(catalog.find().dataset.unique(), np.ndarray)
+        assert catalog.frame.version.max() == max(catalog.frame.version)
+        assert len(catalog.find(dataset="dataset1").dataset.unique()) == 1
+        assert len(catalog.find(dataset="missing")) == 0
+
+
+def test_index_files_store_plain_strings():
+    with mock_catalog(2) as catalog:
+        for format in ("feather", "parquet"):
+            schema = catalogs._read_arrow_table(catalog._catalog_channel_file("garden", format)).schema
+            for col in catalogs.CATEGORICAL_COLUMNS:
+                if col in schema.names:
+                    assert schema.field(col).type == "string"
+
+
+def test_coerce_keeps_missing_is_public():
+    df = catalogs._coerce_is_public(pd.DataFrame({"is_public": [True, None, False]}))
+    assert df.is_public.tolist() == [True, None, False]
+
+    df = catalogs._coerce_is_public(pd.DataFrame({"is_public": pd.Series([True, False], dtype=object)}))
+    assert df.is_public.dtype == bool
+
+
+def test_dimensions_are_loaded():
+    with mock_catalog(2) as catalog:
+        reloaded = LocalCatalog(catalog.path)
+        assert reloaded.frame.dimensions.map(list).tolist() == catalog.frame.dimensions.map(list).tolist()
+        assert "dimensions" in reloaded.find().columns
+
+        # still there for code that asks for them
+        assert reloaded.load_dimensions() is reloaded.frame
+
+
+def test_read_legacy_json_dimensions():
+    with mock_catalog(2) as catalog:
+        # older indexes stored dimensions as JSON strings
+        filename = catalog._catalog_channel_file("garden")
+        df = pd.read_feather(filename)
+        df["dimensions"] = df.dimensions.map(lambda d: json.dumps(list(d)))
+        df.to_feather(filename)
+
+        frame = LocalCatalog(catalog.path).frame
+        assert frame.dimensions.map(list).tolist() == [["country"]] * len(frame)
+
+
 def test_getitem_from_local_catalog():
     with mock_catalog(1) as catalog:
         path = catalog.find().iloc[0].path
@@ -69,6 +205,24 @@ def test_load_from_local_catalog():
         catalog.find().iloc[0].load()
 
 
+def test_load_one_row_frame_from_local_catalog():
+    with mock_catalog(1) as catalog:
+        row = catalog.frame.iloc[0]
+        matches = catalog.find(table=row.table, dataset=row.dataset)
+        # mock table names can be substrings of each other
+        t = matches[matches.table == row.table].load()
+        assert isinstance(t, Table)
+        assert t.metadata.short_name == row.table
+
+
+def test_find_latest_from_local_catalog():
+    with mock_catalog(3) as catalog:
+        frame = catalog.frame[catalog.frame.dataset == "dataset1"]
+        latest = frame.version.max()
+        t = catalog.find_latest(dataset="dataset1", table=frame[frame.version == latest].table.iloc[-1])
+        assert t.metadata.dataset.version == latest  # type: ignore
+
+
 def test_local_default_channel():
     with mock_catalog(1, channels=("open_numbers",)) as catalog:
         catalog.find()
@@ -89,6 +243,70 @@ def test_calling_find_adds_channels():
     assert set(REMOTE_CATALOG.channels) == {"garden", "meadow"}  # type: ignore
 
 
+def test_add_channel_only_downloads_new_channels(monkeypatch):
+    with mock_catalog(2, channels=("garden", "meadow")) as catalog:
+        remote = RemoteCatalog(catalog.path.as_posix() + "/", channels=("garden",))
+        frame = remote.frame
+
+        downloads = []
+
+        def cached_download(uri):
+            downloads.append(uri)
+            return uri
+
+        monkeypatch.setattr(http, "cached_download", cached_download)
+
+        # already loaded, nothing to fetch
+        remote.add_channel("garden")
+        assert downloads == []
+        assert remote.frame is frame
+
+        remote.add_channel("meadow")
+        assert downloads == [catalog.path.as_posix() + "/catalog-meadow.feather"]
+        assert set(remote.frame.channel) == {"garden", "meadow"}
+
+
+def test_remote_metadata_is_revalidated(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path)
+    versions = iter([1, 2])
+
+    def get(uri, headers=None, **kwargs):
+        version = next(versions)
+        return FakeResponse(200, json.dumps({"format_version": version}).encode(), {"ETag": f'"{version}"'})
+
+    monkeypatch.setattr(http.SESSION, "get", get)
+
+    uri = "https://example.com/catalog.meta.json"
+    assert RemoteCatalog._read_metadata(uri) == {"format_version": 1}
+    assert RemoteCatalog._read_metadata(uri) == {"format_version": 2}
+
+
+def test_only_missing_channels_are_indexed():
+    with mock_catalog(2, channels=("garden", "meadow")) as catalog:
+        for filename in catalog.path.glob("catalog-meadow.*"):
+            filename.unlink()
+
+        # the garden index should be reused as is
+        garden_file = catalog._catalog_channel_file("garden")
+        os.utime(garden_file, (0, 0))
+
+        reloaded = LocalCatalog(catalog.path, channels=("garden", "meadow"))
+        assert os.stat(garden_file).st_mtime == 0
+        assert catalog._catalog_channel_file("meadow").exists()
+        assert len(reloaded.frame) == len(catalog.frame)
+        assert set(reloaded.frame.channel) == {"garden", "meadow"}
+
+
+def test_channels_can_be_a_generator():
+    with mock_catalog(2, channels=("garden", "meadow")) as catalog:
+        for filename in catalog.path.glob("catalog-meadow.*"):
+            filename.unlink()
+
+        reloaded = LocalCatalog(catalog.path, channels=(c for c in ("garden", "meadow")))
+        assert set(reloaded.channels) == {"garden", "meadow"}
+        assert set(reloaded.frame.channel) == {"garden", "meadow"}
+
+
 def test_reindex_with_include():
     with mock_catalog(3, channels=("garden",)) as catalog:
         old_frame = catalog.frame.copy()
@@ -111,6 +329,51 @@ def test_reindex_with_include():
         )
 
 
+class FakeS3Client:
+    """Serves objects from a dict, like a bucket would."""
+
+    def __init__(self, objects: Dict[str, bytes]) -> None:
+        self.objects = objects
+
+    def download_fileobj(self, bucket: str, key: str, buffer: Any, **kwargs: Any) -> None:
+        if (bucket, key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "GetObject")
+        buffer.write(self.objects[(bucket, key)])
+
+
+def mock_private_table(monkeypatch, tmp_path: Path, format: str) -> Table:
+    """Put a table and its sidecar in a fake private bucket, and return the table."""
+    t = mock_table()
+    t.metadata.short_name = "private"
+    t.to(str(tmp_path / f"private.{format}"))
+
+    objects = {
+        ("owid-catalog", f"garden/private.{format}"): (tmp_path / f"private.{format}").read_bytes(),
+        ("owid-catalog", "garden/private.meta.json"): (tmp_path / "private.meta.json").read_bytes(),
+    }
+    monkeypatch.setattr(s3_utils, "connect", lambda: FakeS3Client(objects))
+    return t
+
+
+@pytest.mark.parametrize("format", ["feather", "parquet", "csv"])
+def test_read_private_table(monkeypatch, tmp_path, format):
+    t = mock_private_table(monkeypatch, tmp_path, format)
+
+    row = {"path": "garden/private", "formats": [format], "is_public": False}
+    private = catalogs._load_table(row, "https://catalog.ourworldindata.org/")
+
+    assert private.metadata.short_name == "private"
+    assert private.primary_key == t.primary_key
+    assert private.gdp.tolist() == t.gdp.tolist()
+
+
+def test_read_private_table_missing(monkeypatch, tmp_path):
+    mock_private_table(monkeypatch, tmp_path, "feather")
+
+    with pytest.raises(s3_utils.UploadError):
+        catalogs._read_private_table("https://catalog.ourworldindata.org/garden/missing.feather")
+
+
 @contextmanager
 def mock_catalog(n: int = 3, channels: Iterable[CHANNEL] = ("garden",)) -> Iterator[LocalCatalog]:
     with tempfile.TemporaryDirectory() as dirname:
@@ -3,6 +3,7 @@
 #
 
 import json
+import os
 import random
 import shutil
 import tempfile
@@ -16,7 +17,7 @@ from typing import Any, Iterator, Optional, Union
 import pytest
 import yaml
 
-from owid.catalog import Dataset, DatasetMeta
+from owid.catalog import Dataset, DatasetMeta, datasets
 
 from .mocking import mock
 from .test_tables import mock_table
@@ -179,6 +180,55 @@ def test_dataset_iteration():
         assert i == len(d)
 
 
+def test_table_names_follow_folder_changes():
+    with mock_dataset() as d:
+        names = d.table_names
+
+        # a table written straight into the folder, bypassing `add`
+        t = mock_table()
+        t.metadata.short_name = "written_directly"
+        t.to(join(d.path, "written_directly.feather"))
+
+        assert d.table_names == sorted(names + ["written_directly"])
+        assert "written_directly" in d
+
+
+def test_table_names_follow_changes_within_a_timestamp_tick():
+    with mock_dataset() as d:
+        names = d.table_names
+        mtime_ns = os.stat(d.path).st_mtime_ns
+
+        # as if the filesystem's timestamps were too coarse to see the new file
+        t = mock_table()
+        t.metadata.short_name = "same_tick"
+        t.to(join(d.path, "same_tick.feather"))
+        os.utime(d.path, ns=(mtime_ns, mtime_ns))
+
+        assert d.table_names == sorted(names + ["same_tick"])
+
+
+def test_save_updates_table_metadata():
+    with mock_dataset() as d:
+        d.metadata.title = "A new title"
+        d.save()
+
+        for table in Dataset(d.path):
+            assert table.metadata.dataset.title == "A new title"
+
+        # only the sidecars are rewritten, atomically
+        assert not glob(join(d.path, "*.tmp"))
+
+
+def test_replace_dataset_json():
+    doc = {"short_name": "t", "dataset": {"title": "a\n  }", "sources": [{"name": "x"}]}, "fields": {}}
+    contents = json.dumps(doc, indent=2).encode()
+
+    replaced = datasets._replace_dataset_json(contents, json.dumps({"title": "b"}, indent=2))
+    assert replaced == json.dumps({**doc, "dataset": {"title": "b"}}, indent=2).encode()
+
+    assert datasets._replace_dataset_json(json.dumps(doc).encode(), "{}") is None
+
+
 def test_dataset_hash_changes_with_data_changes():
     with mock_dataset() as d:
         c1 = d.checksum()
@@ -190,6 +240,35 @@ def test_dataset_hash_changes_with_data_changes():
         assert c1 != c2
 
 
+def test_dataset_hash_changes_with_metadata_edits():
+    with mock_dataset() as d:
+        c1 = d.checksum()
+        assert d.checksum() == c1
+
+        metadata_file = d._metadata_files[0]
+        with open(metadata_file, "a") as ostream:
+            ostream.write("\n")
+
+        assert d.checksum() != c1
+
+
+def test_dataset_hash_changes_with_same_size_rewrites():
+    with mock_dataset() as d:
+        c1 = d.checksum()
+
+        # rewritten in place within the same timestamp tick
+        metadata_file = d._metadata_files[0]
+        stat = os.stat(metadata_file)
+        with open(metadata_file, "rb") as istream:
+            contents = istream.read()
+        with open(metadata_file, "r+b") as ostream:
+            ostream.write(contents.swapcase())
+        os.utime(metadata_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+        assert os.stat(metadata_file).st_size == stat.st_size
+        assert d.checksum() != c1
+
+
 def test_dataset_hash_invariant_to_copying():
     # make a mock dataset
     with mock_dataset() as d1:
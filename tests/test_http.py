@@ -0,0 +1,122 @@
+#
+#  test_http.py
+#
+
+import json
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, Optional
+
+import pytest
+
+from owid.catalog import Table, http
+
+
+class FakeResponse:
+    def __init__(self, status_code: int = 200, content: bytes = b"", headers: Optional[dict] = None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+    def __enter__(self) -> "FakeResponse":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+    def raise_for_status(self) -> None:
+        pass
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        yield self.content
+
+
+def test_cached_download_revalidates(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path)
+    requests = []
+
+    def get(uri, headers=None, **kwargs):
+        requests.append(headers)
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, b"contents", {"ETag": '"v1"'})
+
+    monkeypatch.setattr(http.SESSION, "get", get)
+
+    uri = "https://example.com/catalog.feather"
+    first = http.cached_download(uri)
+    second = http.cached_download(uri)
+
+    assert first == second
+    assert Path(first).read_bytes() == b"contents"
+    assert requests == [{}, {"If-None-Match": '"v1"'}]
+
+
+def test_cached_download_ignores_validators_of_another_body(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(http.SESSION, "get", lambda uri, **kwargs: FakeResponse(200, b"v1", {"ETag": '"v1"'}))
+
+    cache_file = Path(http.cached_download("https://example.com/catalog.feather"))
+    cache_file.write_bytes(b"something else")
+
+    requests = []
+
+    def get(uri, headers=None, **kwargs):
+        requests.append(headers)
+        return FakeResponse(200, b"v2", {"ETag": '"v2"'})
+
+    monkeypatch.setattr(http.SESSION, "get", get)
+
+    assert Path(http.cached_download("https://example.com/catalog.feather")).read_bytes() == b"v2"
+    assert requests == [{}]
+
+
+def test_cached_download_without_writable_cache(monkeypatch, tmp_path):
+    # a file where the cache directory should be
+    (tmp_path / "cache").touch()
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr(http.SESSION, "get", lambda uri, **kwargs: FakeResponse(200, b"contents"))
+
+    uri = "https://example.com/catalog.meta.json"
+    assert http.cached_download(uri) == uri
+    assert http.read_bytes(uri) == b"contents"
+
+
+def test_cached_download_cleans_up_after_errors(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path)
+
+    class BrokenResponse(FakeResponse):
+        def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+            yield b"partial"
+            raise ConnectionError("connection dropped")
+
+    monkeypatch.setattr(http.SESSION, "get", lambda uri, **kwargs: BrokenResponse(200))
+
+    with pytest.raises(ConnectionError):
+        http.cached_download("https://example.com/catalog.feather")
+
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+def test_remote_sidecars_are_revalidated_in_memory(monkeypatch, tmp_path):
+    monkeypatch.setattr(http, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(http, "_FETCHED", OrderedDict())
+    requests = []
+
+    def get(uri, headers=None, **kwargs):
+        requests.append(headers)
+        if headers and headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, json.dumps({"short_name": "t"}).encode(), {"ETag": '"v1"'})
+
+    monkeypatch.setattr(http.SESSION, "get", get)
+
+    for _ in range(2):
+        assert Table._read_metadata("https://example.com/t.feather") == {"short_name": "t"}
+
+    assert requests == [{}, {"If-None-Match": '"v1"'}]
+
+    # nothing is kept on disk unless asked to
+    assert list(tmp_path.iterdir()) == []
+    Table._read_metadata("https://example.com/t.feather", cache=True)
+    assert list(tmp_path.iterdir()) != []
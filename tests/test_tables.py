@@ -9,6 +9,7 @@ from os.path import exists, join, splitext
 import jsonschema
 import numpy as np
 import pandas as pd
+import pyarrow.parquet as pq
 import pytest
 
 from owid.catalog.datasets import FileFormat
@@ -353,3 +354,38 @@ def test_set_index_keeps_metadata_inplace() -> None:
     # metadata should be preserved
     assert tb_new["a"].metadata.title == "A"
     assert tb_new["b"].metadata.title == "B"
+
+
+def test_parquet_is_compressed_with_zstd(tmp_path) -> None:
+    t = Table({"gdp": [100, 102, 104], "country": ["AU", "SE", "NA"]})
+    filename = (tmp_path / "table.parquet").as_posix()
+    t.to_parquet(filename)
+
+    column = pq.ParquetFile(filename).metadata.row_group(0).column(0)
+    assert column.compression == "ZSTD"
+
+    t.to_parquet(filename, compression="snappy")
+    assert pq.ParquetFile(filename).metadata.row_group(0).column(0).compression == "SNAPPY"
+
+
+def test_parquet_can_be_written_to_uris(tmp_path, monkeypatch) -> None:
+    t = Table({"gdp": [100, 102, 104], "country": ["AU", "SE", "NA"]})
+    sidecars = []
+    monkeypatch.setattr(Table, "_save_metadata", lambda self, filename: sidecars.append(filename))
+
+    # any URI pyarrow can resolve to a filesystem, rather than only local paths
+    uri = (tmp_path / "table.parquet").as_uri()
+    t.to_parquet(uri)
+
+    assert pq.read_table(tmp_path / "table.parquet").column("gdp").to_pylist() == [100, 102, 104]
+    assert sidecars == [uri[: -len(".parquet")] + ".meta.json"]
+
+
+def test_equals_table_ignores_order_and_dtypes() -> None:
+    t1 = Table({"gdp": [100, 102, np.nan], "country": ["AU", "SE", "NA"]}).set_index("country")
+    t2 = t1.iloc[::-1].copy()
+    t2["gdp"] = t2["gdp"].astype("float32")
+    assert t1.equals_table(t2)
+
+    t2.loc["SE", "gdp"] = 103
+    assert not t1.equals_table(t2)